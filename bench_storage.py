@@ -0,0 +1,164 @@
+#=========================
+# 保存形式のベンチマーク
+#=========================
+# 旧形式(整形json)とスナップショット形式の保存・読込時間とファイルサイズを比較する
+# 起動時の読込はSQLite(サーバーid一覧と全リマインダー)なので、旧形式の起動時の読込とも比較する
+# 使い方: python bench_storage.py [--guilds 1000] [--reminders 1000] [--repeat 3]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+# bot.pyのimport時に作られるストレージを一時ディレクトリに逃がす
+WORK_DIR = tempfile.mkdtemp(prefix="milkbot_bench_")
+os.chdir(WORK_DIR)
+import bot
+
+#=====テストデータ作成=====
+def make_data(guilds, reminders):
+    base = datetime(2030, 1, 1, tzinfo=bot.JST)
+    data = {}
+    rid = 0
+    for g in range(guilds):
+        guild_id = 100000000000000000 + g
+        guild_reminders = {}
+        for r in range(reminders):
+            rid += 1
+            dt = base + timedelta(minutes=r)
+            guild_reminders.setdefault(dt, []).append(
+                {"id": rid,
+                 "repeat": "day" if r % 3 == 0 else None,
+                 "interval": 1 if r % 3 == 0 else 0,
+                 "channel_id": 200000000000000000 + r % 5,
+                 "msg": f"リマインダー {r}",
+                 "until": None,
+                 "count": None}
+            )
+        msg_id = 300000000000000000 + g
+        data[guild_id] = {
+            "reminders": guild_reminders,
+            "votes": {msg_id: {"question": "次回の集合時間は？", "reactions": ["1️⃣", "2️⃣"], "options": ["21時", "22時"], "live": False, "channel_id": None}},
+            "proxy_votes": {msg_id: {f"voter{v}": {"agent_id": 400000000000000000 + v, "opt_idx": [v % 2]} for v in range(5)}},
+            "make_list_channels": [500000000000000000 + g],
+            "batched_list_channels": [],
+            "log_texts": {},
+            "ai_chat_channels": []
+        }
+    return data
+
+#=====旧形式(整形json)=====
+#---保存(旧save_all_data相当)---
+def legacy_save(data, path):
+    data_to_save = {}
+    for guild_id, guild_dict in data.items():
+        data_to_save[guild_id] = guild_dict.copy()
+        data_to_save[guild_id]["reminders"] = {dt.isoformat(): value for dt, value in guild_dict["reminders"].items()}
+        data_to_save[guild_id]["log_texts"] = {}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data_to_save, file, ensure_ascii=False, indent=2)
+
+#---読込(旧起動時処理相当)---
+def legacy_load(path):
+    with open(path, "r", encoding="utf-8") as file:
+        raw_data = json.load(file)
+    data = {int(key): value for key, value in raw_data.items()}
+    for guild_id, guild_dict in data.items():
+        data[guild_id]["reminders"] = {datetime.fromisoformat(key): value for key, value in guild_dict["reminders"].items()}
+        data[guild_id]["votes"] = {int(key): value for key, value in guild_dict["votes"].items()}
+        data[guild_id]["proxy_votes"] = {int(key): value for key, value in guild_dict["proxy_votes"].items()}
+    return data
+
+#=====スナップショット形式=====
+def snapshot_save(data, path):
+    text = bot.dump_snapshot(data)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+def snapshot_load(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return bot.load_snapshot(file.read())[0]
+
+#=====SQLite(現在の保存先)=====
+def sqlite_save(data, path):
+    if os.path.exists(path):
+        os.remove(path)
+    repository = bot.DataRepository(path)
+    with repository.conn:
+        for guild_id, guild_dict in data.items():
+            repository.replace_guild(guild_id, guild_dict)
+    repository.conn.close()
+
+#---起動時の読込(GuildDataCacheの初期化相当、サーバーごとの辞書は初回アクセス時に読む)---
+def sqlite_startup(path):
+    repository = bot.DataRepository(path)
+    repository.load_guild_ids()
+    repository.load_reminders()
+    repository.conn.close()
+
+#=====計測=====
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="all_data保存形式のベンチマーク")
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--reminders", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"building data: {args.guilds} guilds x {args.reminders} reminders")
+    data = make_data(args.guilds, args.reminders)
+    legacy_path = os.path.join(WORK_DIR, "legacy.json")
+    snapshot_path = os.path.join(WORK_DIR, "snapshot.json")
+    sqlite_path = os.path.join(WORK_DIR, "bench", "all_data.db")
+
+    results = {
+        "legacy": {
+            "save": best_of(args.repeat, legacy_save, data, legacy_path),
+            "load": best_of(args.repeat, legacy_load, legacy_path),
+            "size": os.path.getsize(legacy_path),
+        },
+        "snapshot": {
+            "save": best_of(args.repeat, snapshot_save, data, snapshot_path),
+            "load": best_of(args.repeat, snapshot_load, snapshot_path),
+            "size": os.path.getsize(snapshot_path),
+        },
+    }
+    # 起動時の読込(旧形式ではjson全体の読込)
+    sqlite_save(data, sqlite_path)
+    results["sqlite_startup"] = {
+        "load": best_of(args.repeat, sqlite_startup, sqlite_path),
+        "size": os.path.getsize(sqlite_path),
+    }
+    # 旧形式のjsonをマイグレーション経由で読む時間(初回移行時のみ発生)
+    results["legacy_via_migration"] = {
+        "load": best_of(args.repeat, snapshot_load, legacy_path),
+    }
+
+    # 読み込んだ内容が一致するか確認
+    assert snapshot_load(snapshot_path).keys() == legacy_load(legacy_path).keys()
+
+    print(f"{'format':<24}{'save (s)':>12}{'load (s)':>12}{'size (MB)':>12}")
+    for name, result in results.items():
+        save = f"{result['save']:.3f}" if "save" in result else "-"
+        size = f"{result['size'] / 1024 / 1024:.1f}" if "size" in result else "-"
+        print(f"{name:<24}{save:>12}{result['load']:>12.3f}{size:>12}")
+    legacy, snapshot, startup = results["legacy"], results["snapshot"], results["sqlite_startup"]
+    print(f"snapshot/legacy: save x{legacy['save'] / snapshot['save']:.1f}, "
+          f"load x{legacy['load'] / snapshot['load']:.1f}, "
+          f"size {snapshot['size'] / legacy['size']:.0%}")
+    print(f"startup (sqlite/legacy json): load x{legacy['load'] / startup['load']:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#=========================
+# 投票処理のベンチマーク
+#=========================
+# 偽のメッセージ・リアクション・メンバーで投票の集計から表示・CSV出力までを計測する
+# 使い方: python bench_vote.py [--options 10] [--reactors 5000] [--proxies 2000] [--repeat 5]
+#                              [--save baseline.json] [--baseline baseline.json] [--tolerance 0.2]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+# --save/--baselineの相対パスは実行したディレクトリ基準
+START_DIR = os.getcwd()
+# bot.pyのimport時に作られるストレージを一時ディレクトリに逃がす
+WORK_DIR = tempfile.mkdtemp(prefix="milkbot_bench_")
+os.chdir(WORK_DIR)
+import bot
+
+# 集計のたびに出る情報ログは計測の邪魔になるので抑える
+logging.getLogger("milkbot").setLevel(logging.WARNING)
+
+GUILD_ID = 100000000000000000
+CHANNEL_ID = 200000000000000000
+MSG_ID = 300000000000000000
+USER_ID_BASE = 400000000000000000
+REACTIONS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+
+#=====偽のdiscordオブジェクト=====
+class FakeUser:
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.bot = bot
+
+# サーバーのメンバー(表示名はdiscord.Memberだけキャッシュされるので、isinstanceの判定を通す)
+class FakeMember(FakeUser):
+    @property
+    def __class__(self):
+        return bot.discord.Member
+
+class FakeReaction:
+    def __init__(self, emoji, users):
+        self.emoji = emoji
+        self._users = users
+
+    async def users(self):
+        for user in self._users:
+            yield user
+
+class FakeMessage:
+    def __init__(self, msg_id, reactions):
+        self.id = msg_id
+        self.reactions = reactions
+
+class FakeChannel:
+    def __init__(self, channel_id, message):
+        self.id = channel_id
+        self.message = message
+
+    async def fetch_message(self, msg_id):
+        return self.message
+
+class FakeGuild:
+    def __init__(self, guild_id, members):
+        self.id = guild_id
+        self.members = members
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    async def query_members(self, user_ids, cache=True):
+        return [self.members[user_id] for user_id in user_ids if user_id in self.members]
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, **kwargs):
+        self.sent += 1
+
+class FakeInteraction:
+    def __init__(self, guild, channel):
+        self.guild = guild
+        self.channel = channel
+        self.message = None
+        self.followup = FakeFollowup()
+
+#=====テストデータ作成=====
+def make_poll(options, reactors, proxies):
+    reactions = REACTIONS[:options]
+    members = {}
+    voters = [[] for _ in range(options)]
+    # 1人あたり1〜3個の選択肢にリアクション
+    for n in range(reactors):
+        user = FakeMember(USER_ID_BASE + n, f"member{n}")
+        members[user.id] = user
+        for k in range(1 + n % 3):
+            voters[(n + k * 7) % options].append(user)
+    message = FakeMessage(MSG_ID, [FakeReaction(emoji, users) for emoji, users in zip(reactions, voters)])
+
+    bot.preset_dict(GUILD_ID)
+    bot.add_vote(GUILD_ID, MSG_ID, "次回の集合時間は？", reactions, [f"選択肢{i + 1}" for i in range(options)])
+    # 代理投票(代理人は既存メンバー、1人あたり1〜2個の選択肢)
+    for n in range(proxies):
+        agent_id = USER_ID_BASE + n % max(reactors, 1)
+        bot.add_proxy_vote(GUILD_ID, MSG_ID, f"proxy{n}", agent_id, sorted({n % options, (n * 3) % options}))
+    bot.persister.flush_sync()
+
+    guild = FakeGuild(GUILD_ID, members)
+    channel = FakeChannel(CHANNEL_ID, message)
+    return guild, channel
+
+#=====計測=====
+# 同期関数もイベントループ上で同じように計測する
+async def call(func, *args):
+    return func(*args)
+
+def measure(loop, repeat, func, setup=None):
+    # 1回目はウォームアップ
+    if setup:
+        setup()
+    loop.run_until_complete(func())
+
+    elapsed = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        loop.run_until_complete(func())
+        elapsed.append(time.perf_counter() - start)
+
+    # メモリのピークは計測時間に影響しないよう別に1回だけ測る
+    if setup:
+        setup()
+    tracemalloc.start()
+    loop.run_until_complete(func())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": repeat / sum(elapsed),
+        "best_ms": min(elapsed) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+def run(args):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # fetch_reaction_usersがbot自身のリアクションを除くのに使う
+    bot.bot._connection.user = FakeUser(1, "milk-bot", bot=True)
+
+    print(f"building poll: {args.options} options, {args.reactors} reactors, {args.proxies} proxy votes")
+    guild, channel = make_poll(args.options, args.reactors, args.proxies)
+    interaction = FakeInteraction(guild, channel)
+    dt, result = loop.run_until_complete(bot.make_vote_result(interaction, MSG_ID))
+
+    # 起動直後相当(集計とメンバー名のキャッシュなし)
+    def cold():
+        bot.vote_tally.forget(MSG_ID)
+        bot.member_names.cache.clear()
+
+    cases = {
+        "make_vote_result (cold)": (lambda: bot.make_vote_result(interaction, MSG_ID), cold),
+        "make_vote_result (warm)": (lambda: bot.make_vote_result(interaction, MSG_ID), None),
+        "make_grouped_rows": (lambda: call(bot.make_grouped_rows, result), None),
+        "make_listed_rows": (lambda: call(bot.make_listed_rows, result), None),
+        "show_vote_result": (lambda: bot.show_vote_result(interaction, dt, result, MSG_ID, "mid"), None),
+        "export_vote_csv": (lambda: bot.export_vote_csv(interaction, result, MSG_ID, dt, "mid"), None),
+    }
+    results = {name: measure(loop, args.repeat, func, setup) for name, (func, setup) in cases.items()}
+    loop.close()
+    return results
+
+#=====ベースラインとの比較=====
+# ops/secの低下またはメモリのピークの増加がtoleranceを超えたものを返す
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: ops/sec {base['ops_per_sec']:.1f} -> {result['ops_per_sec']:.1f}")
+        if result["peak_kib"] > base["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{name}: peak {base['peak_kib']:.0f} KiB -> {result['peak_kib']:.0f} KiB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="投票処理のベンチマーク")
+    parser.add_argument("--options", type=int, default=10)
+    parser.add_argument("--reactors", type=int, default=5000)
+    parser.add_argument("--proxies", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="結果をベースラインとして保存するjsonのパス")
+    parser.add_argument("--baseline", help="比較するベースラインjsonのパス")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する悪化の割合")
+    args = parser.parse_args()
+    if not 1 <= args.options <= len(REACTIONS):
+        parser.error(f"--options must be 1-{len(REACTIONS)}")
+
+    results = run(args)
+
+    print(f"{'case':<28}{'ops/sec':>12}{'best (ms)':>12}{'peak (KiB)':>12}")
+    for name, result in results.items():
+        print(f"{name:<28}{result['ops_per_sec']:>12.1f}{result['best_ms']:>12.2f}{result['peak_kib']:>12.0f}")
+
+    params = {"options": args.options, "reactors": args.reactors, "proxies": args.proxies, "repeat": args.repeat}
+    if args.save:
+        with open(os.path.join(START_DIR, args.save), "w", encoding="utf-8") as file:
+            json.dump({"params": params, "results": results}, file, ensure_ascii=False, indent=2)
+        print(f"baseline saved: {args.save}")
+
+    if args.baseline:
+        with open(os.path.join(START_DIR, args.baseline), "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline["params"] != params:
+            print(f"⚠ baseline params differ: {baseline['params']}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 #=========================
 # ライブラリのインポート
 #=========================
+import time
+import sys
+# 起動時間計測の基準時刻
+STARTUP_T0 = time.perf_counter()
 import discord
 from discord import opus
 from discord.ext import commands
@@ -9,32 +13,105 @@ import asyncio
 from datetime import datetime, timedelta, timezone
 import os
 import json
+import copy
+import sqlite3
 import emoji
+import threading
+import heapq
+import itertools
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 import csv, io
-from google.cloud import vision
-from google.oauth2 import service_account
-from google import genai
-from google.genai import types
+import tempfile
+import gzip
+import shutil
+import hashlib
+import importlib
 import aiohttp
-import requests
 from functools import wraps
 import inspect
-from ibm_watson import SpeechToTextV1
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 import ctypes
 import ctypes.util
 from pydub import AudioSegment, effects
 from dotenv import load_dotenv
 import traceback
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+
+#=====ログ設定=====
+# LOG_LEVEL: 出力レベル(DEBUG/INFO/WARNING/ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# LOG_MESSAGE_SAMPLE: メッセージ受信ごとのDEBUGログをN件に1件だけ出力
+LOG_MESSAGE_SAMPLE = int(os.getenv("LOG_MESSAGE_SAMPLE", "100"))
+
+#---DEBUGログの間引き---
+class SamplingFilter(logging.Filter):
+    # クラスの初期設定
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, rate)
+        self.count = 0
+
+    # DEBUGはrate件に1件だけ通し、INFO以上はすべて通す
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        self.count += 1
+        return self.count % self.rate == 1 or self.rate == 1
+
+#---ログ出力の準備---
+# 書き出しはQueueListenerのスレッドで行い、イベントループを止めない
+def setup_logging():
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # 時刻はJSTで表示(書き出し時ではなくログ発生時の時刻)
+    formatter.converter = lambda ts: datetime.fromtimestamp(ts, timezone(timedelta(hours=9))).timetuple()
+    handler.setFormatter(formatter)
+    root_logger = logging.getLogger("milkbot")
+    root_logger.setLevel(LOG_LEVEL)
+    root_logger.addHandler(QueueHandler(log_queue))
+    root_logger.propagate = False
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    # 終了時に残りのログを書き出す
+    atexit.register(listener.stop)
+    return listener
+
+log_listener = setup_logging()
+#---処理系統ごとのロガー---
+log = logging.getLogger("milkbot")
+persist_log = logging.getLogger("milkbot.persist")
+reminder_log = logging.getLogger("milkbot.reminder")
+vote_log = logging.getLogger("milkbot.vote")
+ocr_log = logging.getLogger("milkbot.ocr")
+voice_log = logging.getLogger("milkbot.voice")
+ai_log = logging.getLogger("milkbot.ai")
+list_log = logging.getLogger("milkbot.list")
+message_log = logging.getLogger("milkbot.message")
+message_log.addFilter(SamplingFilter(LOG_MESSAGE_SAMPLE))
+
+#=====起動時間の計測=====
+# python bot.py --startup-profile で各処理の所要時間を表示して終了する
+STARTUP_PROFILE = "--startup-profile" in sys.argv
+startup_marks = []
+
+def mark_startup(label):
+    startup_marks.append((label, time.perf_counter()))
+
+mark_startup("imports")
 
 load_dotenv()
 
 if not opus.is_loaded():
     opus.load_opus("libopus.so.0")
 
-print(f"discord version: {discord.__version__}")
-print(f"discord opus loaded: {discord.opus.is_loaded()}")
+log.info("discord version: %s", discord.__version__)
+log.info("discord opus loaded: %s", discord.opus.is_loaded())
+mark_startup("opus")
 
 #=====Botの準備=====
 intents = discord.Intents.default()
@@ -42,25 +119,94 @@ intents.message_content = True
 intents.members = True
 intents.voice_states = True
 intents.guilds = True
-bot = commands.Bot(command_prefix="!", intents=intents)
 
-#=====サービスアカウントキーの読込=====
+class MilkBot(commands.Bot):
+    # 終了時に共有のHTTPセッションとOCR用のスレッドも閉じる
+    async def close(self):
+        try:
+            await http_session.close()
+            ocr_executor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            await super().close()
+
+bot = MilkBot(command_prefix="!", intents=intents)
+
+#=====外部APIクライアントの遅延生成=====
+# SDKのimportとクライアント生成は初回利用時まで行わず、以後は同じものを使い回す
+class LazyClientRegistry:
+    # クラスの初期設定
+    def __init__(self):
+        self.factories = {}
+        self.clients = {}
+        # 計測結果(import/生成ごとの所要秒数)
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    # クライアントの登録(必要なモジュール名と生成関数)
+    def register(self, name, modules, factory):
+        self.factories[name] = (modules, factory)
+
+    # クライアントの取得(初回のみimportと生成を行う)
+    def get(self, name):
+        if name in self.clients:
+            return self.clients[name]
+        with self.lock:
+            if name not in self.clients:
+                modules, factory = self.factories[name]
+                imported = []
+                for module_name in modules:
+                    start = time.perf_counter()
+                    imported.append(importlib.import_module(module_name))
+                    self.timings[f"import {module_name}"] = time.perf_counter() - start
+                start = time.perf_counter()
+                self.clients[name] = factory(*imported)
+                self.timings[f"init {name}"] = time.perf_counter() - start
+                log.info("client initialized: %s (%.3fs)", name, self.timings[f"init {name}"])
+        return self.clients[name]
+
 #---Vision API---
-key_path = os.environ["GOOGLE_APPLICATION_CREDENTIALS_JSON"]
-with open(key_path, 'r') as f:
-    info = json.load(f)
-credentials = service_account.Credentials.from_service_account_info(info)
-vision_client = vision.ImageAnnotatorClient(credentials=credentials)
+def create_vision_client(vision, service_account):
+    # サービスアカウントキーの読込
+    key_path = os.environ["GOOGLE_APPLICATION_CREDENTIALS_JSON"]
+    with open(key_path, 'r') as f:
+        info = json.load(f)
+    credentials = service_account.Credentials.from_service_account_info(info)
+    return vision.ImageAnnotatorClient(credentials=credentials)
 
 #---Gemini API---
-gemini_client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+def create_gemini_client(genai):
+    return genai.Client(api_key=os.environ["GEMINI_API_KEY"])
 
 #---Watson STT---
-WATSON_STT_API_KEY = os.getenv("WATSON_STT_API_KEY")
-WATSON_STT_URL = os.getenv("WATSON_STT_URL")
-authenticator = IAMAuthenticator(WATSON_STT_API_KEY)
-stt = SpeechToTextV1(authenticator=authenticator)
-stt.set_service_url(WATSON_STT_URL)
+def create_stt_client(ibm_watson, authenticators):
+    authenticator = authenticators.IAMAuthenticator(os.getenv("WATSON_STT_API_KEY"))
+    stt = ibm_watson.SpeechToTextV1(authenticator=authenticator)
+    stt.set_service_url(os.getenv("WATSON_STT_URL"))
+    return stt
+
+clients = LazyClientRegistry()
+clients.register("vision", ["google.cloud.vision", "google.oauth2.service_account"], create_vision_client)
+clients.register("gemini", ["google.genai"], create_gemini_client)
+clients.register("stt", ["ibm_watson", "ibm_cloud_sdk_core.authenticators"], create_stt_client)
+# NumPyは表OCRでしか使わないので同じく初回利用時にimportする
+clients.register("numpy", ["numpy"], lambda numpy: numpy)
+
+#---起動時間の表示---
+def print_startup_profile():
+    print("=== startup profile ===")
+    prev = STARTUP_T0
+    for label, t in startup_marks:
+        print(f"{label:<40} {t - prev:8.3f}s")
+        prev = t
+    print(f"{'total (until connect)':<40} {prev - STARTUP_T0:8.3f}s")
+    # 遅延生成しているクライアントの初回コストを計測
+    for name in clients.factories:
+        try:
+            clients.get(name)
+        except Exception as e:
+            print(f"{'init ' + name:<40} failed: {e}")
+    for label, seconds in clients.timings.items():
+        print(f"{label:<40} {seconds:8.3f}s")
 
 #===================================
 # 定数・グローバル変数・辞書の準備
@@ -68,46 +214,656 @@ stt.set_service_url(WATSON_STT_URL)
 #=====タイムゾーンの指定=====
 JST = timezone(timedelta(hours=9), "JST")
 
-#=====辞書読込共通処理=====
-def load_data(data):
-    try:
-        # jsonが存在すれば
-        if os.path.exists(f"./data/{data}.json"):
-            # fileオブジェクト変数に格納
-            with open(f"./data/{data}.json", "r", encoding = "utf-8") as file:
-                print(f"loaded dict: {datetime.now(JST)} - {data}")
-                return json.load(file)
+#=====SQLiteストレージ=====
+DB_PATH = "./data/all_data.db"
+
+#---スキーマのマイグレーション---
+# 適用済みの版はPRAGMA user_versionに記録し、未適用のものだけを順に一度ずつ実行する
+def migrate_schema_v1(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS guilds (
+            guild_id INTEGER PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            fire_at INTEGER NOT NULL,
+            repeat TEXT,
+            interval INTEGER,
+            channel_id INTEGER NOT NULL,
+            msg TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_reminders_fire_at ON reminders (fire_at);
+        CREATE INDEX IF NOT EXISTS idx_reminders_guild ON reminders (guild_id, fire_at);
+        CREATE TABLE IF NOT EXISTS votes (
+            msg_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            question TEXT,
+            reactions TEXT NOT NULL,
+            options TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_votes_guild ON votes (guild_id);
+        CREATE TABLE IF NOT EXISTS proxy_votes (
+            msg_id INTEGER NOT NULL,
+            voter TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            agent_id INTEGER NOT NULL,
+            opt_idx TEXT NOT NULL,
+            PRIMARY KEY (msg_id, voter)
+        );
+        CREATE INDEX IF NOT EXISTS idx_proxy_votes_guild ON proxy_votes (guild_id);
+        CREATE TABLE IF NOT EXISTS make_list_channels (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        );
+        CREATE TABLE IF NOT EXISTS ai_chat_channels (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        );
+    """)
+
+# v2: 繰り返しの終了日時と回数の上限
+def migrate_schema_v2(conn):
+    conn.execute("ALTER TABLE reminders ADD COLUMN until INTEGER")
+    conn.execute("ALTER TABLE reminders ADD COLUMN count INTEGER")
+
+# v3: 投票のライブ表示
+def migrate_schema_v3(conn):
+    conn.execute("ALTER TABLE votes ADD COLUMN live INTEGER NOT NULL DEFAULT 0")
+
+# v4: リスト化のまとめ投稿モード
+def migrate_schema_v4(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS batched_list_channels (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
+        )
+    """)
+
+# v5: 投票結果のアーカイブ(追記のみ)
+def migrate_schema_v5(conn):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS vote_archive (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            msg_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            options TEXT NOT NULL,
+            finalized_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_vote_archive_guild_time ON vote_archive (guild_id, finalized_at);
+        CREATE TABLE IF NOT EXISTS vote_archive_ballots (
+            archive_id INTEGER NOT NULL REFERENCES vote_archive (id),
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            agent_id INTEGER,
+            option_idx INTEGER NOT NULL,
+            finalized_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_vote_archive_ballots_poll ON vote_archive_ballots (archive_id);
+        CREATE INDEX IF NOT EXISTS idx_vote_archive_ballots_member ON vote_archive_ballots (guild_id, user_id, finalized_at);
+    """)
+
+# v6: 投票のチャンネルid(再起動後のライブ表示の書き換え用)
+def migrate_schema_v6(conn):
+    conn.execute("ALTER TABLE votes ADD COLUMN channel_id INTEGER")
+
+SCHEMA_MIGRATIONS = [migrate_schema_v1, migrate_schema_v2, migrate_schema_v3, migrate_schema_v4, migrate_schema_v5, migrate_schema_v6]
+
+# 書込はWriteBehindPersister経由でまとめてコミットする
+class DataRepository:
+    CHANNEL_TABLES = ("make_list_channels", "batched_list_channels", "ai_chat_channels")
+
+    # クラスの初期設定
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.migrate()
+        # リマインダーidは書込を待たずに採番する
+        self.last_reminder_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM reminders").fetchone()[0]
+
+    #---スキーマを最新版に更新---
+    def migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            with self.conn:
+                migration(self.conn)
+                self.conn.execute(f"PRAGMA user_version = {target}")
+            persist_log.info("schema migrated: v%s -> v%s", target - 1, target)
+
+    #---サーバー---
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM guilds LIMIT 1").fetchone() is None
+
+    def add_guild(self, guild_id):
+        self.conn.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+
+    #---リマインダー---
+    def allocate_reminder_id(self):
+        self.last_reminder_id += 1
+        return self.last_reminder_id
+
+    def add_reminder(self, reminder_id, guild_id, dt, repeat, interval, channel_id, msg, until=None, count=None):
+        self.conn.execute(
+            "INSERT INTO reminders (id, guild_id, fire_at, repeat, interval, channel_id, msg, until, count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (reminder_id, guild_id, int(dt.timestamp()), repeat, interval, channel_id, msg, until and int(until.timestamp()), count)
+        )
+
+    def remove_reminders(self, reminder_ids):
+        self.conn.executemany("DELETE FROM reminders WHERE id = ?", [(rid,) for rid in reminder_ids])
+
+    #---投票---
+    def upsert_vote(self, guild_id, msg_id, question, reactions, options, live=False, channel_id=None):
+        self.conn.execute(
+            "INSERT INTO votes (msg_id, guild_id, question, reactions, options, live, channel_id) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (msg_id) DO UPDATE SET question = excluded.question, reactions = excluded.reactions, options = excluded.options, "
+            "live = excluded.live, channel_id = excluded.channel_id",
+            (msg_id, guild_id, question, json.dumps(reactions, ensure_ascii=False), json.dumps(options, ensure_ascii=False), int(live), channel_id)
+        )
+
+    def remove_vote(self, msg_id):
+        self.conn.execute("DELETE FROM votes WHERE msg_id = ?", (msg_id,))
+
+    #---代理投票---
+    def upsert_proxy_vote(self, guild_id, msg_id, voter, agent_id, opt_idx):
+        self.conn.execute(
+            "INSERT INTO proxy_votes (msg_id, voter, guild_id, agent_id, opt_idx) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (msg_id, voter) DO UPDATE SET agent_id = excluded.agent_id, opt_idx = excluded.opt_idx",
+            (msg_id, voter, guild_id, agent_id, json.dumps(opt_idx, separators=(",", ":")))
+        )
+
+    def remove_proxy_votes(self, msg_id, voter=None):
+        if voter is None:
+            self.conn.execute("DELETE FROM proxy_votes WHERE msg_id = ?", (msg_id,))
         else:
-            #jsonが存在しない場合は、戻り値を空の辞書にする
-            print(f"dict {data}: not exist")
-            return {}
-    except Exception as e:
-        print(f"dict {data}: load error: {e}")
-        return {}
-    
+            self.conn.execute("DELETE FROM proxy_votes WHERE msg_id = ? AND voter = ?", (msg_id, voter))
+
+    #---チャンネルリスト---
+    def add_channel(self, table, guild_id, channel_id):
+        assert table in self.CHANNEL_TABLES
+        self.conn.execute(f"INSERT OR IGNORE INTO {table} (guild_id, channel_id) VALUES (?, ?)", (guild_id, channel_id))
+
+    def remove_channel(self, table, guild_id, channel_id):
+        assert table in self.CHANNEL_TABLES
+        self.conn.execute(f"DELETE FROM {table} WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id))
+
+    #---投票結果アーカイブ(追記のみ)---
+    # options: [[絵文字, 選択肢], ...], ballots: [[選択肢番号, ユーザーid, 名前, 代理人id], ...]
+    def archive_vote(self, guild_id, msg_id, question, finalized_at, options, ballots):
+        archive_id = self.conn.execute(
+            "INSERT INTO vote_archive (guild_id, msg_id, question, options, finalized_at) VALUES (?, ?, ?, ?, ?)",
+            (guild_id, msg_id, question, json.dumps(options, ensure_ascii=False), finalized_at)
+        ).lastrowid
+        self.conn.executemany(
+            "INSERT INTO vote_archive_ballots (archive_id, guild_id, user_id, name, agent_id, option_idx, finalized_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(archive_id, guild_id, user_id, name, agent_id, option_idx, finalized_at) for option_idx, user_id, name, agent_id in ballots]
+        )
+
+    # 期間内の投票を新しい順に取得(user_id指定時はその人の選択、それ以外は選択肢ごとの票数)
+    def query_vote_archive(self, guild_id, since, until, user_id=None, limit=20):
+        polls = [
+            {"id": archive_id, "msg_id": msg_id, "question": question, "options": json.loads(options), "finalized_at": finalized_at, "choices": {}}
+            for archive_id, msg_id, question, options, finalized_at in self.conn.execute(
+                "SELECT id, msg_id, question, options, finalized_at FROM vote_archive "
+                "WHERE guild_id = ? AND finalized_at BETWEEN ? AND ? ORDER BY finalized_at DESC, id DESC LIMIT ?",
+                (guild_id, since, until, limit)
+            )
+        ]
+        if not polls:
+            return polls
+        by_id = {poll["id"]: poll for poll in polls}
+        placeholders = ",".join("?" * len(by_id))
+        if user_id is None:
+            rows = self.conn.execute(
+                f"SELECT archive_id, option_idx, COUNT(*) FROM vote_archive_ballots WHERE archive_id IN ({placeholders}) GROUP BY archive_id, option_idx",
+                tuple(by_id)
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT archive_id, option_idx, 1 FROM vote_archive_ballots "
+                "WHERE guild_id = ? AND user_id = ? AND finalized_at BETWEEN ? AND ?",
+                (guild_id, user_id, polls[-1]["finalized_at"], polls[0]["finalized_at"])
+            )
+        for archive_id, option_idx, count in rows:
+            if archive_id in by_id:
+                by_id[archive_id]["choices"][option_idx] = count
+        return polls
+
+    #---サーバーid一覧---
+    def load_guild_ids(self):
+        return {guild_id for (guild_id,) in self.conn.execute("SELECT guild_id FROM guilds")}
+
+    #---全サーバーのリマインダー(スケジューラ用に起動時に読込)---
+    def load_reminders(self):
+        index = {}
+        # 同一日時の予定は登録順に並べる
+        for rid, guild_id, fire_at, repeat, interval, channel_id, msg, until, count in self.conn.execute(
+            "SELECT id, guild_id, fire_at, repeat, interval, channel_id, msg, until, count FROM reminders ORDER BY fire_at, id"
+        ):
+            dt = datetime.fromtimestamp(fire_at, JST)
+            index.setdefault(guild_id, {}).setdefault(dt, []).append(
+                {"id": rid,
+                 "repeat": repeat,
+                 "interval": interval,
+                 "channel_id": channel_id,
+                 "msg": msg,
+                 "until": until and datetime.fromtimestamp(until, JST),
+                 "count": count}
+            )
+        return index
+
+    #---サーバー単位の辞書形式での読込(リマインダー以外)---
+    def load_guild(self, guild_id):
+        guild_dict = {
+            "reminders": {},
+            "votes": {},
+            "proxy_votes": {},
+            "make_list_channels": [],
+            "batched_list_channels": [],
+            "log_texts": {},
+            "ai_chat_channels": []
+        }
+        for msg_id, question, reactions, options, live, channel_id in self.conn.execute(
+            "SELECT msg_id, question, reactions, options, live, channel_id FROM votes WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+        ):
+            guild_dict["votes"][msg_id] = {
+                "question": question,
+                "reactions": json.loads(reactions),
+                "options": json.loads(options),
+                "live": bool(live),
+                "channel_id": channel_id
+            }
+        for msg_id, voter, agent_id, opt_idx in self.conn.execute(
+            "SELECT msg_id, voter, agent_id, opt_idx FROM proxy_votes WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+        ):
+            guild_dict["proxy_votes"].setdefault(msg_id, {})[voter] = {
+                "agent_id": agent_id,
+                "opt_idx": json.loads(opt_idx)
+            }
+        for table in self.CHANNEL_TABLES:
+            for (channel_id,) in self.conn.execute(f"SELECT channel_id FROM {table} WHERE guild_id = ? ORDER BY rowid", (guild_id,)):
+                guild_dict[table].append(channel_id)
+        return guild_dict
+
+    #---サーバー単位の辞書全体の書込(一括移行用)---
+    def replace_guild(self, guild_id, guild_dict):
+        for table in ("reminders", "votes", "proxy_votes") + self.CHANNEL_TABLES:
+            self.conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+        self.conn.execute("INSERT OR IGNORE INTO guilds (guild_id) VALUES (?)", (guild_id,))
+        for dt, values in guild_dict["reminders"].items():
+            for value in values:
+                self.add_reminder(
+                    value["id"], guild_id, dt, value["repeat"], value["interval"], value["channel_id"], value["msg"], value["until"], value["count"]
+                )
+        for msg_id, value in guild_dict["votes"].items():
+            self.upsert_vote(guild_id, msg_id, value["question"], value["reactions"], value["options"], value["live"], value["channel_id"])
+        for msg_id, voters in guild_dict["proxy_votes"].items():
+            for voter, value in voters.items():
+                self.conn.execute(
+                    "INSERT INTO proxy_votes (msg_id, voter, guild_id, agent_id, opt_idx) VALUES (?, ?, ?, ?, ?)",
+                    (msg_id, voter, guild_id, value["agent_id"], json.dumps(value["opt_idx"]))
+                )
+        for table in self.CHANNEL_TABLES:
+            for channel_id in guild_dict.get(table, []):
+                self.conn.execute(f"INSERT OR IGNORE INTO {table} (guild_id, channel_id) VALUES (?, ?)", (guild_id, channel_id))
+
+#=====遅延書込=====
+# 書込までの待ち時間(秒)。この間の変更は1回のコミットにまとめる
+PERSIST_DELAY = float(os.getenv("PERSIST_DELAY", "0.25"))
+# 書込に失敗したサーバーを再試行する回数
+PERSIST_MAX_RETRIES = 3
+
+class WriteBehindPersister:
+    # クラスの初期設定
+    def __init__(self, repository, delay):
+        self.repository = repository
+        self.delay = delay
+        # コミット待ちの書込処理(変更のあったサーバーごと)
+        self.dirty = {}
+        # 書込に失敗したサーバーの再試行回数
+        self.retries = {}
+        self.timer = None
+        self.flushing = None
+        # 書込専用スレッド
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+        self.lock = threading.Lock()
+
+    # 書込処理をサーバーごとに登録してコミットを予約
+    def submit(self, guild_id, func, *args):
+        self.dirty.setdefault(guild_id, []).append((func, args))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # イベントループ外(起動処理中など)ではその場でコミット
+            self.flush_sync()
+            return
+        if self.timer is None:
+            self.timer = loop.call_later(self.delay, self.start_flush)
+
+    # 予約時刻になったらスレッドでコミット開始
+    def start_flush(self):
+        self.timer = None
+        if self.dirty:
+            self.flushing = asyncio.ensure_future(self.flush())
+
+    # 待機中の書込をまとめてコミット
+    async def flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.dirty = self.dirty, {}
+        if batch:
+            loop = asyncio.get_running_loop()
+            failed = await loop.run_in_executor(self.executor, self.commit, batch)
+            self.requeue(batch, failed)
+            if self.dirty and self.timer is None:
+                self.timer = loop.call_later(self.delay, self.start_flush)
+
+    # 終了時などイベントループ外からのコミット(失敗したサーバーは上限まで続けて再試行)
+    def flush_sync(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        while self.dirty:
+            batch, self.dirty = self.dirty, {}
+            self.requeue(batch, self.commit(batch))
+
+    # 失敗したサーバーの書込をその後の変更より前に戻す(上限を超えたら破棄)
+    def requeue(self, batch, failed):
+        for guild_id in batch:
+            if guild_id not in failed:
+                self.retries.pop(guild_id, None)
+        for guild_id, changes in failed.items():
+            retries = self.retries.get(guild_id, 0) + 1
+            if retries > PERSIST_MAX_RETRIES:
+                self.retries.pop(guild_id, None)
+                persist_log.error("persist gave up: guild %s (%d changes dropped)", guild_id, len(changes))
+                continue
+            self.retries[guild_id] = retries
+            self.dirty[guild_id] = changes + self.dirty.get(guild_id, [])
+
+    # 変更のあったサーバー分を1トランザクションでコミットし、失敗したサーバーの書込を返す
+    # サーバーごとにセーブポイントを置き、失敗したサーバーの変更だけを取り消す
+    def commit(self, batch):
+        failed = {}
+        with self.lock:
+            conn = self.repository.conn
+            try:
+                with conn:
+                    for guild_id, changes in batch.items():
+                        conn.execute("SAVEPOINT guild")
+                        try:
+                            for func, args in changes:
+                                func(*args)
+                        except Exception as e:
+                            conn.execute("ROLLBACK TO guild")
+                            failed[guild_id] = changes
+                            persist_log.exception("persist error: guild %s: %s", guild_id, e)
+                        conn.execute("RELEASE guild")
+                persist_log.debug("persisted: %d guilds, %d changes", len(batch) - len(failed), sum(len(changes) for guild_id, changes in batch.items() if guild_id not in failed))
+            except Exception as e:
+                # コミット自体の失敗は全サーバーを再試行
+                persist_log.exception("persist error: %s", e)
+                failed = batch
+        return failed
+
+#=====サーバー単位の遅延読込=====
+# 統合辞書はサーバーに初めて触れた時点でストレージから読み込む
+class GuildDataCache(dict):
+    # クラスの初期設定
+    def __init__(self, repository, lock):
+        super().__init__()
+        self.repository = repository
+        self.lock = lock
+        # 登録済みサーバーid
+        self.guild_ids = repository.load_guild_ids()
+        # リマインダーはスケジューラが使うので全サーバー分を先に読み込む
+        self.reminder_index = repository.load_reminders()
+
+    # 未読込のサーバーはストレージから読み込む
+    def __missing__(self, guild_id):
+        if guild_id not in self.guild_ids:
+            raise KeyError(guild_id)
+        with self.lock:
+            guild_dict = self.repository.load_guild(guild_id)
+        guild_dict["reminders"] = self.reminder_index.setdefault(guild_id, {})
+        self[guild_id] = guild_dict
+        persist_log.debug("loaded guild: %s", guild_id)
+        return guild_dict
+
+    # 新しいサーバーの辞書を登録
+    def register(self, guild_id, guild_dict):
+        self.guild_ids.add(guild_id)
+        self.reminder_index[guild_id] = guild_dict["reminders"]
+        self[guild_id] = guild_dict
+
+    # 全サーバーを読込(エクスポート用)
+    def load_all(self):
+        for guild_id in self.guild_ids:
+            self[guild_id]
+
 #=====各辞書読込前処理=====
 #---統合辞書---
-raw_data = load_data("all_data")
-try:
-    if raw_data:
-        print("exist raw_data")
-        all_data = {int(key): value for key, value in raw_data.items()}
-        print(f"all_data: {all_data}")
-        for guild_id, guild_dict in all_data.items():
-            # リマインダー辞書キーのdtをdatetime型に戻す
-            all_data[guild_id]["reminders"] = {datetime.fromisoformat(key): value for key, value in guild_dict["reminders"].items()}
-            # 投票辞書キーのmsg_idをint型に戻す
-            all_data[guild_id]["votes"] = {int(key): value for key, value in guild_dict["votes"].items()}
-            # 代理投票辞書キーのmsg_idをint型に戻す
-            all_data[guild_id]["proxy_votes"] = {int(key): value for key, value in guild_dict["proxy_votes"].items()}
-    else:
-        print("not exist raw_data")
-        all_data = {}
-except Exception as e:
-    print(f"raw_data convert error: {e}")
-    all_data = {}
+# SQLiteストレージを開き、サーバーid一覧とリマインダーだけを読み込む
+repository = DataRepository(DB_PATH)
+persister = WriteBehindPersister(repository, PERSIST_DELAY)
+all_data = GuildDataCache(repository, persister.lock)
+mark_startup("storage")
+
+persist_log.info("dict all_data: %s guilds, %s guilds with reminders", len(all_data.guild_ids), len(all_data.reminder_index))
+
+#=====繰り返し単位=====
+REPEAT_UNITS = {
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+    "minute": timedelta(minutes=1)
+}
+
+#=====リマインダーの発生日時=====
+# 繰り返し予定は登録日時を起点とした1件のレコードのまま、次回日時をその都度計算する
+# afterより後の最初の回を返す(終了日時や回数の上限を過ぎていればNone)
+def next_occurrence(dt, rmd_dt, after):
+    if dt > after:
+        return dt
+    if rmd_dt["repeat"] not in REPEAT_UNITS:
+        return None
+    # 間隔0は1として扱い、停止中などで過ぎた回は飛ばす
+    step = REPEAT_UNITS[rmd_dt["repeat"]] * max(rmd_dt["interval"], 1)
+    k = (after - dt) // step + 1
+    if rmd_dt["count"] and k >= rmd_dt["count"]:
+        return None
+    occurrence = dt + step * k
+    if rmd_dt["until"] and occurrence > rmd_dt["until"]:
+        return None
+    return occurrence
+
+# afterより後の回を最大limit件
+def upcoming_occurrences(dt, rmd_dt, after, limit):
+    occurrences = []
+    occurrence = next_occurrence(dt, rmd_dt, after)
+    while occurrence and len(occurrences) < limit:
+        occurrences.append(occurrence)
+        occurrence = next_occurrence(dt, rmd_dt, occurrence)
+    return occurrences
+
+#=====リマインダースケジューラ=====
+# (通知時刻, 登録順, サーバーid, リマインダーid, 登録日時, 発生日時)の最小ヒープで、次の通知時刻まで待機する
+# 削除時はヒープに触れず、取り出し時にリマインダー辞書に残っているかで判定する(遅延削除)
+# 繰り返し予定の通知済の回はメモリ上のカーソルだけで管理し、ストレージには書き込まない
+class ReminderScheduler:
+    # 無効な項目がこの件数を超え、かつ半数を超えたらヒープを作り直す
+    COMPACT_THRESHOLD = 1024
+    # 時計の補正に備えて最長でもこの秒数で起きる
+    MAX_SLEEP = 3600
 
-print(f"dict all_data: {all_data}")
+    # クラスの初期設定
+    def __init__(self, reminder_index):
+        self.reminder_index = reminder_index
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # リマインダーid -> 最後に通知した日時
+        self.cursors = {}
+        self.rebuild()
+
+    # 次に通知する日時(通知済の回と過去の繰り返し回は飛ばす)
+    def next_fire(self, dt, rmd_dt, now):
+        # 単発の予定は過去でも未通知なら通知する
+        if not rmd_dt["repeat"]:
+            return None if rmd_dt["id"] in self.cursors else dt
+        return next_occurrence(dt, rmd_dt, max(self.cursors.get(rmd_dt["id"], now), now))
+
+    # リマインダー辞書からヒープを作り直す(起動時・データ移行時。過ぎた繰り返しは現在以降から数える)
+    def rebuild(self):
+        now = datetime.now(JST)
+        self.heap = []
+        for guild_id, reminders in self.reminder_index.items():
+            for dt, values in reminders.items():
+                for value in values:
+                    occurrence = self.next_fire(dt, value, now)
+                    # 終了済の繰り返し予定は送信せずに削除するため先頭に置く
+                    fire_at = occurrence.timestamp() if occurrence else 0
+                    self.heap.append((fire_at, next(self.seq), guild_id, value["id"], dt, occurrence))
+        heapq.heapify(self.heap)
+        self.stale = 0
+        self.wakeup.set()
+
+    # 予定を追加し、先頭が変わったらループを起こす
+    def push(self, guild_id, dt, reminder_id, occurrence=None):
+        occurrence = occurrence or dt
+        item = (occurrence.timestamp(), next(self.seq), guild_id, reminder_id, dt, occurrence)
+        heapq.heappush(self.heap, item)
+        if self.heap[0] is item:
+            self.wakeup.set()
+
+    # 削除された件数を記録し、無効な項目が増えすぎたらヒープを作り直す
+    def discard(self, count=1):
+        self.stale += count
+        if self.stale > self.COMPACT_THRESHOLD and self.stale * 2 > len(self.heap):
+            reminder_log.debug("compact heap: %s items, %s stale", len(self.heap), self.stale)
+            self.compact()
+
+    # 削除済の項目だけを取り除く(通知前の予定は時刻を計算し直さずそのまま残す)
+    def compact(self):
+        self.heap = [item for item in self.heap if self.lookup(item[2], item[4], item[3]) is not None]
+        heapq.heapify(self.heap)
+        self.stale = 0
+        self.wakeup.set()
+
+    # リマインダー辞書に残っている予定を取得
+    def lookup(self, guild_id, dt, reminder_id):
+        for value in self.reminder_index.get(guild_id, {}).get(dt, []):
+            if value["id"] == reminder_id:
+                return value
+        return None
+
+    # 通知時刻を過ぎた予定を取り出す
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, guild_id, reminder_id, dt, occurrence = heapq.heappop(self.heap)
+            value = self.lookup(guild_id, dt, reminder_id)
+            # 削除済の予定は読み飛ばす
+            if value is None:
+                self.stale = max(self.stale - 1, 0)
+                self.cursors.pop(reminder_id, None)
+                continue
+            due.append((guild_id, dt, occurrence, value))
+        return due
+
+    # 次の予定の時刻まで待機(より早い予定が追加されたら起きる)
+    async def wait(self, now):
+        self.wakeup.clear()
+        timeout = self.MAX_SLEEP
+        if self.heap:
+            timeout = min(max(self.heap[0][0] - now, 0), self.MAX_SLEEP)
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+scheduler = ReminderScheduler(all_data.reminder_index)
+reminder_log.info("scheduler: %s reminders", len(scheduler.heap))
+
+#=====リマインダー送信=====
+# 同時送信数の上限
+REMINDER_WORKERS = int(os.getenv("REMINDER_WORKERS", "8"))
+# 遅延の統計に使う直近の件数
+REMINDER_LAG_WINDOW = 1000
+
+# チャンネルごとのキューに積み、上限付きで並行送信する(同じチャンネル内は登録順)
+class ReminderDispatcher:
+    # クラスの初期設定
+    def __init__(self, max_workers):
+        self.semaphore = asyncio.Semaphore(max_workers)
+        # 送信待ちのキュー(チャンネルごと)
+        self.queues = {}
+        self.tasks = set()
+        # 予定時刻から送信完了までの遅延(秒)
+        self.lags = deque(maxlen=REMINDER_LAG_WINDOW)
+        self.sent = 0
+        self.failed = 0
+
+    # 送信を予約(チャンネルのキューが空なら送信タスクを起動)
+    def dispatch(self, channel_id, dt, msg):
+        queue = self.queues.get(channel_id)
+        if queue is not None:
+            queue.append((dt, msg))
+            return
+        self.queues[channel_id] = deque([(dt, msg)])
+        task = asyncio.create_task(self.drain(channel_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # チャンネルのキューを順番に送信
+    async def drain(self, channel_id):
+        queue = self.queues[channel_id]
+        try:
+            while queue:
+                dt, msg = queue.popleft()
+                async with self.semaphore:
+                    await self.send(channel_id, dt, msg)
+        finally:
+            del self.queues[channel_id]
+
+    # 1件送信して遅延を記録
+    async def send(self, channel_id, dt, msg):
+        channel = bot.get_channel(channel_id)
+        if not channel:
+            self.failed += 1
+            reminder_log.warning("チャンネル取得失敗: %s", channel_id)
+            return
+        try:
+            await channel.send(f"{msg}")
+        except discord.HTTPException as e:
+            self.failed += 1
+            reminder_log.warning("メッセージ送信失敗: %s: %s", channel_id, e)
+            return
+        lag = time.time() - dt.timestamp()
+        self.lags.append(lag)
+        self.sent += 1
+        reminder_log.info("チャンネルにメッセージを送信: %s (lag %.3fs)", format_reminder_dt(dt), lag)
+
+    # 遅延の統計(直近REMINDER_LAG_WINDOW件)
+    def lag_stats(self):
+        if not self.lags:
+            return {"sent": self.sent, "failed": self.failed}
+        lags = sorted(self.lags)
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "avg": sum(lags) / len(lags),
+            "p95": lags[min(int(len(lags) * 0.95), len(lags) - 1)],
+            "max": lags[-1]
+        }
+
+dispatcher = ReminderDispatcher(REMINDER_WORKERS)
 
 # #---リマインダー辞書---
 # raw_data = load_data("reminders")
@@ -159,32 +915,19 @@ print(f"dict all_data: {all_data}")
 #=====辞書プリセット処理=====
 def preset_dict(guild_id):
     # 統合辞書にサーバーidが登録されていなければ、空の辞書を作成
-    if guild_id not in all_data:
-        print("[all_data presetting: guild: {guild_id}]")
-        all_data[guild_id] = {
+    if guild_id not in all_data.guild_ids:
+        persist_log.info("all_data presetting: guild: %s", guild_id)
+        all_data.register(guild_id, {
             "reminders": {},
             "votes": {},
             "proxy_votes": {},
             "make_list_channels": [],
+            "batched_list_channels": [],
             "log_texts": {},
             "ai_chat_channels": []
-        }
-        save_all_data()
-
-#=====追加・削除辞書の初期化処理=====
-def initialize_new_dict():
-    for guild_id in all_data:
-        # 旧rec_sessions辞書が残っている場合は削除
-        if "rec_sessions" in all_data[guild_id]:
-                del all_data[guild_id]["rec_sessions"]
-        # log_texts辞書がない場合は追加
-        if "log_texts" not in all_data[guild_id]:
-                all_data[guild_id]["log_texts"] = {}
-        # ai_chat_channelsリストがない場合は追加
-        if "ai_chat_channels" not in all_data[guild_id]:
-                all_data[guild_id]["ai_chat_channels"] = []
-        print(f"all_data: {all_data}")
-        
+        })
+        persister.submit(guild_id, repository.add_guild, guild_id)
+
 #===============
 # 共通処理関数
 #===============
@@ -204,35 +947,176 @@ def clean_slash_options(func):
 #---------------
 # 辞書関係
 #---------------
-#=====辞書をjsonファイルに保存=====
-def export_data(data: dict, name: str):
+#=====ファイル保存(一時ファイル経由)=====
+def export_data(text: str, name: str):
+    path = f"./data/{name}.json"
     try:
         # 指定ディレクトリがなければ作成する
         os.makedirs(f"./data", exist_ok=True)
-        #jsonファイルを開く（存在しなければ作成する）
-        with open(f"./data/{name}.json", "w", encoding = "utf-8") as file:
-            # jsonファイルを保存
-            json.dump(data, file, ensure_ascii=False, indent=2)
-        print(f"saved dict: {datetime.now(JST)} - {name}")
+        #一時ファイルに書き込んでから置き換える
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+        persist_log.info("saved dict: %s", name)
     except Exception as e:
-        print(f"saving dict error: {e}")
+        persist_log.error("saving dict error: %s", e)
+    return path
+
+#=====スナップショット(エクスポート・移行用)=====
+# 版番号付きの詰めたjson。キーは文字列化せず、行の配列として型を保ったまま保存する
+SNAPSHOT_FORMAT = "milkbot-snapshot"
+SNAPSHOT_VERSION = 5
+
+#---旧形式(版番号なしの整形json)からv1への変換---
+def migrate_snapshot_v0(raw):
+    guilds = []
+    for key, guild_dict in raw.items():
+        # 反映済みジャーナル番号は辞書ではないので除外
+        if key == "_journal_seq":
+            continue
+        guilds.append({
+            "id": int(key),
+            "reminders": [
+                [value.get("id"), int(datetime.fromisoformat(dt).timestamp()), value["repeat"], value["interval"], value["channel_id"], value["msg"]]
+                for dt, values in guild_dict["reminders"].items()
+                for value in values
+            ],
+            "votes": [
+                [int(msg_id), value["question"], value["reactions"], value["options"]]
+                for msg_id, value in guild_dict["votes"].items()
+            ],
+            "proxy_votes": [
+                [int(msg_id), voter, value["agent_id"], value["opt_idx"]]
+                for msg_id, voters in guild_dict["proxy_votes"].items()
+                for voter, value in voters.items()
+            ],
+            # 古い辞書にはai_chat_channelsがない場合がある(rec_sessionsは移行しない)
+            "make_list_channels": guild_dict.get("make_list_channels", []),
+            "ai_chat_channels": guild_dict.get("ai_chat_channels", [])
+        })
+    return {"format": SNAPSHOT_FORMAT, "version": 1, "journal_seq": raw.get("_journal_seq", 0), "guilds": guilds}
+
+#---v1からv2への変換(リマインダーに繰り返しの終了日時と回数を追加)---
+def migrate_snapshot_v1(raw):
+    for guild in raw["guilds"]:
+        guild["reminders"] = [row + [None, None] for row in guild["reminders"]]
+    raw["version"] = 2
+    return raw
+
+#---v2からv3への変換(投票にライブ表示の有無を追加)---
+def migrate_snapshot_v2(raw):
+    for guild in raw["guilds"]:
+        guild["votes"] = [row + [False] for row in guild["votes"]]
+    raw["version"] = 3
+    return raw
+
+#---v3からv4への変換(リスト化のまとめ投稿チャンネルを追加)---
+def migrate_snapshot_v3(raw):
+    for guild in raw["guilds"]:
+        guild["batched_list_channels"] = []
+    raw["version"] = 4
+    return raw
+
+#---v4からv5への変換(投票にチャンネルidを追加)---
+def migrate_snapshot_v4(raw):
+    for guild in raw["guilds"]:
+        guild["votes"] = [row + [None] for row in guild["votes"]]
+    raw["version"] = 5
+    return raw
+
+# 変換元の版 -> 次の版への変換処理
+SNAPSHOT_MIGRATIONS = {
+    0: migrate_snapshot_v0,
+    1: migrate_snapshot_v1,
+    2: migrate_snapshot_v2,
+    3: migrate_snapshot_v3,
+    4: migrate_snapshot_v4,
+}
+
+#---統合辞書をスナップショットに変換---
+def dump_snapshot(data):
+    guilds = []
+    for guild_id, guild_dict in data.items():
+        guilds.append({
+            "id": guild_id,
+            "reminders": [
+                [value["id"], int(dt.timestamp()), value["repeat"], value["interval"], value["channel_id"], value["msg"],
+                 value["until"] and int(value["until"].timestamp()), value["count"]]
+                for dt, values in guild_dict["reminders"].items()
+                for value in values
+            ],
+            "votes": [
+                [msg_id, value["question"], value["reactions"], value["options"], value["live"], value["channel_id"]]
+                for msg_id, value in guild_dict["votes"].items()
+            ],
+            "proxy_votes": [
+                [msg_id, voter, value["agent_id"], value["opt_idx"]]
+                for msg_id, voters in guild_dict["proxy_votes"].items()
+                for voter, value in voters.items()
+            ],
+            "make_list_channels": guild_dict["make_list_channels"],
+            "batched_list_channels": guild_dict["batched_list_channels"],
+            "ai_chat_channels": guild_dict["ai_chat_channels"]
+        })
+    snapshot = {"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "guilds": guilds}
+    return json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"))
+
+#---スナップショットを統合辞書に変換(古い版は順に変換してから読む)---
+def load_snapshot(text):
+    raw = json.loads(text)
+    version = raw.get("version", 0) if raw.get("format") == SNAPSHOT_FORMAT else 0
+    while version < SNAPSHOT_VERSION:
+        raw = SNAPSHOT_MIGRATIONS[version](raw)
+        version = raw["version"]
+
+    data = {}
+    for guild in raw["guilds"]:
+        reminders = {}
+        for rid, fire_at, repeat, interval, channel_id, msg, until, count in guild["reminders"]:
+            reminders.setdefault(datetime.fromtimestamp(fire_at, JST), []).append(
+                {"id": rid,
+                 "repeat": repeat,
+                 "interval": interval,
+                 "channel_id": channel_id,
+                 "msg": msg,
+                 "until": until and datetime.fromtimestamp(until, JST),
+                 "count": count}
+            )
+        proxy_votes = {}
+        for msg_id, voter, agent_id, opt_idx in guild["proxy_votes"]:
+            proxy_votes.setdefault(msg_id, {})[voter] = {"agent_id": agent_id, "opt_idx": opt_idx}
+        data[guild["id"]] = {
+            "reminders": reminders,
+            "votes": {
+                msg_id: {"question": question, "reactions": reactions, "options": options, "live": live, "channel_id": channel_id}
+                for msg_id, question, reactions, options, live, channel_id in guild["votes"]
+            },
+            "proxy_votes": proxy_votes,
+            "make_list_channels": guild["make_list_channels"],
+            "batched_list_channels": guild["batched_list_channels"],
+            "log_texts": {},
+            "ai_chat_channels": guild["ai_chat_channels"]
+        }
+    return data, raw.get("journal_seq", 0)
 
-#=====jsonファイル保存前処理=====
-#---統合辞書---
-def save_all_data():
-    print("[start: save_all_data]")
-    data_to_save = {}
+#---統合辞書(エクスポート用)---
+def export_all_data(name="all_data"):
+    persist_log.debug("[start: export_all_data]")
+    all_data.load_all()
+    return export_data(dump_snapshot(all_data), name)
 
+#---統合辞書(読込済みサーバー分の書き直し)---
+def save_all_data():
+    persist_log.debug("[start: save_all_data]")
     for guild_id, guild_dict in all_data.items():
-        data_to_save[guild_id] = guild_dict.copy()
-
-        # reminders辞書のdatetime型をisoformatに直してから保存
-        data_to_save[guild_id]["reminders"] = {dt.isoformat(): value for dt, value in guild_dict["reminders"].items()}
-        # log_texts辞書を空にしてから保存
-        data_to_save[guild_id]["log_texts"] = {}
-
-    print(f"data_to_save: {data_to_save}")
-    export_data(data_to_save, "all_data")
+        # リマインダーidを採番し直す
+        for values in guild_dict["reminders"].values():
+            for value in values:
+                value["id"] = repository.allocate_reminder_id()
+        # 書込スレッドに渡すためlog_texts以外を複製
+        data_to_save = copy.deepcopy({key: value for key, value in guild_dict.items() if key != "log_texts"})
+        persister.submit(guild_id, repository.replace_guild, guild_id, data_to_save)
 
 # #---リマインダー---
 # def save_reminders():
@@ -251,52 +1135,132 @@ def save_all_data():
 # def save_make_list_channels():
 #     export_data(make_list_channels, "make_list_channels")
 
+#=====代理投票の索引=====
+# 投票者 -> 内容 は代理投票辞書そのもの。投票ごとに 選択肢 -> 投票者、代理人id -> 投票者 の索引を持つ
+# 初回参照時に代理投票辞書から作り、以後は追加・取消・削除のたびに更新する
+class ProxyVoteIndex:
+    # クラスの初期設定
+    def __init__(self):
+        # msg_id -> {"options": {選択肢: {投票者: None}}, "agents": {代理人id: {投票者: None}}}
+        self.indexes = {}
+
+    # 投票の索引を取得(未作成なら代理投票辞書から作成)
+    def get(self, msg_id, records):
+        index = self.indexes.get(msg_id)
+        if index is None:
+            index = {"options": {}, "agents": {}}
+            for voter, record in records.items():
+                self.link(index, voter, record)
+            self.indexes[msg_id] = index
+        return index
+
+    # 1件分を索引に追加
+    def link(self, index, voter, record):
+        for opt_idx in record["opt_idx"]:
+            index["options"].setdefault(opt_idx, {})[voter] = None
+        index["agents"].setdefault(record["agent_id"], {})[voter] = None
+
+    # 1件分を索引から削除
+    def unlink(self, index, voter, record):
+        for opt_idx in record["opt_idx"]:
+            index["options"].get(opt_idx, {}).pop(voter, None)
+        index["agents"].get(record["agent_id"], {}).pop(voter, None)
+
+    # 投票内容の変更を反映(索引が未作成なら次回参照時に作る)
+    def update(self, msg_id, voter, old_record, new_record):
+        index = self.indexes.get(msg_id)
+        if index is None:
+            return
+        if old_record:
+            self.unlink(index, voter, old_record)
+        if new_record:
+            self.link(index, voter, new_record)
+
+    # 投票の索引を破棄
+    def forget(self, msg_id):
+        self.indexes.pop(msg_id, None)
+
+    # 選択肢ごとの投票者
+    def voters_by_option(self, msg_id, records, opt_idx):
+        return list(self.get(msg_id, records)["options"].get(opt_idx, {}))
+
+    # 代理人が代理投票した投票者
+    def voters_by_agent(self, msg_id, records, agent_id):
+        return list(self.get(msg_id, records)["agents"].get(agent_id, {}))
+
+proxy_index = ProxyVoteIndex()
+
 #=====辞書への登録処理=====
 #---リマインダー辞書---
-def add_reminder(guild_id, dt, repeat, interval, channel_id, msg):
+def add_reminder(guild_id, dt, repeat, interval, channel_id, msg, until=None, count=None):
     reminders = all_data[guild_id]["reminders"]
     # 日時が辞書になければ辞書に行を追加
     if dt not in reminders:
         reminders[dt] = []
     # 辞書に項目を登録
     reminders[dt].append(
-        {"repeat": repeat,
+        {"id": None,
+         "repeat": repeat,
          "interval": interval,
          "channel_id": channel_id,
-         "msg": msg}
+         "msg": msg,
+         "until": until,
+         "count": count}
     )
-    # json保存前処理
-    save_all_data()
+    # ストレージに登録
+    reminder_id = repository.allocate_reminder_id()
+    reminders[dt][-1]["id"] = reminder_id
+    persister.submit(guild_id, repository.add_reminder, reminder_id, guild_id, dt, repeat, interval, channel_id, msg, until, count)
+    # スケジューラに登録
+    scheduler.push(guild_id, dt, reminder_id)
 
 #---投票辞書---
-def add_vote(guild_id, msg_id, question, reactions, options):
+def add_vote(guild_id, msg_id, question, reactions, options, live=False, channel_id=None):
     votes = all_data[guild_id]["votes"]
     # 辞書に項目を登録
     votes[msg_id] = {
         "question": question,
         "reactions": reactions,
-        "options": options
+        "options": options,
+        "live": live,
+        "channel_id": channel_id
     }
 
-    # json保存前処理
-    save_all_data()
+    # ストレージに登録
+    persister.submit(guild_id, repository.upsert_vote, guild_id, msg_id, question, list(reactions), list(options), live, channel_id)
 
 #---代理投票辞書---
 def add_proxy_vote(guild_id, msg_id, voter, agent_id, opt_idx):
-    print("[start: add_proxy_vote]")
+    vote_log.debug("[start: add_proxy_vote]")
     proxy_votes = all_data[guild_id]["proxy_votes"]
     # msg_idが辞書になければ辞書に行を追加
     if msg_id not in proxy_votes:
         proxy_votes[msg_id] = {}
     
     # 辞書に項目を登録
+    old_record = proxy_votes[msg_id].get(voter)
     proxy_votes[msg_id][voter] = {
         "agent_id": agent_id,
         "opt_idx": opt_idx
     }
-
-    # json保存前処理
-    save_all_data()
+    proxy_index.update(msg_id, voter, old_record, proxy_votes[msg_id][voter])
+
+    # ストレージに登録
+    persister.submit(guild_id, repository.upsert_proxy_vote, guild_id, msg_id, voter, agent_id, list(opt_idx))
+    live_polls.touch(guild_id, msg_id)
+
+#---投票結果アーカイブ(最終結果のみ追記)---
+def archive_vote(guild_id, msg_id, dt, result):
+    question = all_data[guild_id]["votes"].get(msg_id, {}).get("question", "")
+    options = [[str(value["emoji"]), value["option"]] for value in result.values()]
+    ballots = [
+        [i, user_id, name, agent_id]
+        for i, value in result.items()
+        for user_id, name, agent_id in value["ballots"]
+    ]
+    # ストレージに追記
+    persister.submit(None, repository.archive_vote, guild_id, msg_id, question, int(dt.timestamp()), options, ballots)
+    vote_log.info("投票結果をアーカイブ: %s", question)
 
 #---リスト化対象チャンネルリスト---
 def add_make_list_channel(guild_id, channel_id):
@@ -304,10 +1268,20 @@ def add_make_list_channel(guild_id, channel_id):
     # リストに項目を登録
     if channel_id not in make_list_channels:
         make_list_channels.append(channel_id)
-        print(f"make_list_channels: {make_list_channels}")
-
-    # json保存前処理
-    save_all_data()
+        list_log.debug("make_list_channels: %s", make_list_channels)
+        # ストレージに登録
+        persister.submit(guild_id, repository.add_channel, "make_list_channels", guild_id, channel_id)
+
+#---リスト化のまとめ投稿モード---
+def set_list_batched(guild_id, channel_id, batched):
+    batched_list_channels = all_data[guild_id]["batched_list_channels"]
+    if batched and channel_id not in batched_list_channels:
+        batched_list_channels.append(channel_id)
+        persister.submit(guild_id, repository.add_channel, "batched_list_channels", guild_id, channel_id)
+    elif not batched and channel_id in batched_list_channels:
+        batched_list_channels.remove(channel_id)
+        persister.submit(guild_id, repository.remove_channel, "batched_list_channels", guild_id, channel_id)
+    list_log.debug("batched_list_channels: %s", batched_list_channels)
 
 #---AIチャットチャンネルリスト---
 def add_ai_channel(guild_id, channel_id):
@@ -315,14 +1289,13 @@ def add_ai_channel(guild_id, channel_id):
     # リストに項目を登録
     if channel_id not in ai_chat_channels:
         ai_chat_channels.append(channel_id)
-        print(f"ai_chat_channels: {ai_chat_channels}")
-
-    # json保存前処理
-    save_all_data()
+        ai_log.debug("ai_chat_channels: %s", ai_chat_channels)
+        # ストレージに登録
+        persister.submit(guild_id, repository.add_channel, "ai_chat_channels", guild_id, channel_id)
 
 #---ログテキスト辞書---
 def add_log_text(guild_id, channel_id):
-    print("[start: add_log_text]")
+    voice_log.debug("[start: add_log_text]")
     log_texts = all_data[guild_id]["log_texts"]
     # channel_idが辞書になければ辞書に行を追加
     if channel_id not in log_texts:
@@ -338,11 +1311,12 @@ def remove_reminder(guild_id, dt, idx=None):
             removed = reminders[dt]
             del reminders[dt]
             #save_reminders()
-            save_all_data()
-            print(f"リマインダーを削除: {dt.strftime('%Y/%m/%d %H:%M')}")
+            persister.submit(guild_id, repository.remove_reminders, [value["id"] for value in removed])
+            scheduler.discard(len(removed))
+            reminder_log.info("リマインダーを削除: %s", format_reminder_dt(dt))
             return removed
         else:
-            print(f"削除対象のリマインダーがありません")
+            reminder_log.info("削除対象のリマインダーがありません")
             return None
     else:
         if dt in reminders and 0 <= (idx-1) < len(reminders[dt]):
@@ -351,104 +1325,188 @@ def remove_reminder(guild_id, dt, idx=None):
             if not reminders[dt]:
                 del reminders[dt]
             #save_reminders()
-            save_all_data()
-            print(f"リマインダーを削除: {dt.strftime('%Y/%m/%d %H:%M')} - {removed['msg']}")
+            persister.submit(guild_id, repository.remove_reminders, [removed["id"]])
+            scheduler.discard()
+            reminder_log.info("リマインダーを削除: %s - %s", format_reminder_dt(dt), removed['msg'])
             return removed
         else:
-            print(f"削除対象のリマインダーがありません")
+            reminder_log.info("削除対象のリマインダーがありません")
             return None
 
+#---リマインダー辞書(通知済の1件)---
+# スケジューラから取り出し済なのでヒープの無効件数には数えない
+# ストレージへの反映は呼び出し側で通知1回分をまとめて行う
+def detach_reminder(guild_id, dt, reminder_id):
+    reminders = all_data.reminder_index.get(guild_id, {})
+    values = reminders.get(dt, [])
+    for i, value in enumerate(values):
+        if value["id"] == reminder_id:
+            del values[i]
+            break
+    # 値が空の日時全体を削除
+    if not values:
+        reminders.pop(dt, None)
+
 #---投票辞書---
 def remove_vote(guild_id, msg_id):
-    print("[start: remove_vote]")
+    vote_log.debug("[start: remove_vote]")
     votes = all_data[guild_id]["votes"]
     if msg_id in votes:
         removed = votes[msg_id]
         del votes[msg_id]
         #save_votes()
-        save_all_data()
-        print(f"投票を削除: {removed['question']}")
+        persister.submit(guild_id, repository.remove_vote, msg_id)
+        vote_tally.forget(msg_id)
+        live_polls.forget(msg_id)
+        vote_log.info("投票を削除: %s", removed['question'])
         return removed
     else:
-        print(f"削除対象の投票がありません")
+        vote_log.info("削除対象の投票がありません")
         return None
         
 #---代理投票辞書---
 def remove_proxy_vote(guild_id, msg_id):
-    print("[start: remove_proxy_vote]")
+    vote_log.debug("[start: remove_proxy_vote]")
     proxy_votes = all_data[guild_id]["proxy_votes"]
     if msg_id in proxy_votes:
         removed = proxy_votes[msg_id]
         del proxy_votes[msg_id]
+        proxy_index.forget(msg_id)
         #save_proxy_votes()
-        save_all_data()
-        print(f"代理投票({msg_id})を削除しました")
+        persister.submit(guild_id, repository.remove_proxy_votes, msg_id)
+        vote_log.info("代理投票(%s)を削除しました", msg_id)
         return removed
     else:
-        print(f"削除対象の代理投票がありません")
+        vote_log.info("削除対象の代理投票がありません")
         return None
 
 #---リスト化対象チャンネルリスト---
 def remove_make_list_channel(guild_id, channel_id, channel_name):
-    print("[start: remove_make_list_channel]")
+    list_log.debug("[start: remove_make_list_channel]")
     make_list_channels = all_data[guild_id]["make_list_channels"]
     if channel_id in make_list_channels:
         make_list_channels.remove(channel_id)
         #save_make_list_channels()
-        save_all_data()
-        print(f"リスト化対象から削除: {channel_name}")
+        persister.submit(guild_id, repository.remove_channel, "make_list_channels", guild_id, channel_id)
+        # まとめ投稿の設定も解除
+        set_list_batched(guild_id, channel_id, False)
+        list_log.info("リスト化対象から削除: %s", channel_name)
         return channel_name
     else:
-        print(f"削除対象のチャンネルがありません")
+        list_log.info("削除対象のチャンネルがありません")
         return None
 
 #---AIチャットチャンネルリスト---
 def remove_ai_channel(guild_id, channel_id, channel_name):
-    print("[start: remove_ai_channel]")
+    ai_log.debug("[start: remove_ai_channel]")
     ai_chat_channels = all_data[guild_id]["ai_chat_channels"]
     if channel_id in ai_chat_channels:
         ai_chat_channels.remove(channel_id)
         #save_ai_chat_channels()
-        save_all_data()
-        print(f"リスト化対象から削除: {channel_name}")
+        persister.submit(guild_id, repository.remove_channel, "ai_chat_channels", guild_id, channel_id)
+        ai_log.info("AIチャット対象から削除: %s", channel_name)
         return channel_name
     else:
-        print(f"削除対象のチャンネルがありません")
+        ai_log.info("削除対象のチャンネルがありません")
         return None
 
 #---ログテキスト辞書---
 def remove_log_text(guild_id, channel_id, channel_name):
-    print("[start: remove_log_texts]")
+    voice_log.debug("[start: remove_log_texts]")
     log_texts = all_data[guild_id]["log_texts"]
     if channel_id in log_texts:
         del log_texts[channel_id]
-        print(f"{channel_name}の録音セッションを終了")
+        voice_log.info("%sの録音セッションを終了", channel_name)
         return
     else:
-        print(f"{channel_name}の録音セッションがありません")
+        voice_log.info("%sの録音セッションがありません", channel_name)
         return
 
 #---代理投票辞書からの個別投票除外---
 def cancel_proxy_vote(guild_id, msg_id, voter, agent_id):
-    print("[start: cancel_proxy_vote]")
-    proxy_votes = all_data[guild_id]["proxy_votes"]
-    if msg_id in proxy_votes:
-        # 該当する投票を取り出して投票者と代理人が一致するものを削除
-        for key, value in proxy_votes[msg_id].items():
-            if (key, value["agent_id"]) == (voter, agent_id):
-                removed = proxy_votes[msg_id][voter]
-                del proxy_votes[msg_id][voter]
-                #save_proxy_votes()
-                save_all_data()
-                print(f"{voter}の代理投票({msg_id})をキャンセルしました")
-                return removed
-            else:
-                print(f"キャンセル対象の代理投票がありません")
-                return None
+    vote_log.debug("[start: cancel_proxy_vote]")
+    records = all_data[guild_id]["proxy_votes"].get(msg_id, {})
+    # 投票者の投票を取り出して代理人が一致すれば削除
+    record = records.get(voter)
+    if record and record["agent_id"] == agent_id:
+        del records[voter]
+        proxy_index.update(msg_id, voter, record, None)
+        #save_proxy_votes()
+        persister.submit(guild_id, repository.remove_proxy_votes, msg_id, voter)
+        live_polls.touch(guild_id, msg_id)
+        vote_log.info("%sの代理投票(%s)をキャンセルしました", voter, msg_id)
+        return record
     else:
-        print(f"キャンセル対象の代理投票がありません")
+        vote_log.info("キャンセル対象の代理投票がありません")
         return None
 
+#=====jsonからの一括移行=====
+LEGACY_JSON_PATH = "./data/all_data.json"
+LEGACY_JOURNAL_PATH = "./data/all_data.journal"
+
+# 旧ジャーナルの再生対象の処理
+LEGACY_JOURNAL_OPS = {
+    "add_reminder": add_reminder,
+    "add_vote": add_vote,
+    "add_proxy_vote": add_proxy_vote,
+    "add_make_list_channel": add_make_list_channel,
+    "add_ai_channel": add_ai_channel,
+    "remove_reminder": remove_reminder,
+    "remove_vote": remove_vote,
+    "remove_proxy_vote": remove_proxy_vote,
+    "remove_make_list_channel": remove_make_list_channel,
+    "remove_ai_channel": remove_ai_channel,
+    "cancel_proxy_vote": cancel_proxy_vote,
+}
+
+def import_json_data():
+    persist_log.debug("[start: import_json_data]")
+    try:
+        # 旧形式のjsonもスナップショットとして版を上げながら読み込む
+        with open(LEGACY_JSON_PATH, "r", encoding="utf-8") as file:
+            data, snapshot_seq = load_snapshot(file.read())
+        for guild_id, guild_dict in data.items():
+            all_data.register(guild_id, guild_dict)
+    except Exception as e:
+        persist_log.error("raw_data convert error: %s", e)
+        return
+
+    # スナップショットの内容をストレージに一括登録
+    save_all_data()
+
+    # スナップショット以降の旧ジャーナルを再生
+    replayed = 0
+    if os.path.exists(LEGACY_JOURNAL_PATH):
+        with open(LEGACY_JOURNAL_PATH, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書込途中で停止した末尾行は無視
+                    continue
+                if record["seq"] <= snapshot_seq:
+                    continue
+                guild_id = record["guild_id"]
+                args = record["args"]
+                try:
+                    if record["op"] == "preset_dict":
+                        preset_dict(guild_id)
+                    else:
+                        # リマインダーの日時をdatetime型に戻す
+                        if record["op"] in ("add_reminder", "remove_reminder"):
+                            args[0] = datetime.fromisoformat(args[0])
+                        LEGACY_JOURNAL_OPS[record["op"]](guild_id, *args)
+                    replayed += 1
+                except Exception as e:
+                    persist_log.warning("journal replay error: %s: %s", record, e)
+        os.replace(LEGACY_JOURNAL_PATH, f"{LEGACY_JOURNAL_PATH}.imported")
+
+    # 移行済みのjsonは退避して再度取り込まないようにする
+    os.replace(LEGACY_JSON_PATH, f"{LEGACY_JSON_PATH}.imported")
+    persist_log.info("imported all_data.json: %s guilds, %s journal records", len(all_data), replayed)
+    # 取り込んだリマインダーでスケジューラを作り直す
+    scheduler.rebuild()
+
 #---------------
 # AI関係処理
 #---------------
@@ -461,10 +1519,11 @@ def make_gemini_text(guild_id, channel_id):
     
 #=====AIへの発注処理=====
 def ai_handler(prompt, text):
+    from google.genai import types
     contexts = f"{prompt}\n{text}"
     search_tool = types.Tool(google_search=types.GoogleSearch())
     config = types.GenerateContentConfig(tools=[search_tool])
-    response = gemini_client.models.generate_content(
+    response = clients.get("gemini").models.generate_content(
         model="gemini-2.5-flash",
         contents=contexts,
         config=config
@@ -475,19 +1534,89 @@ def ai_handler(prompt, text):
 # その他共通処理
 #---------------
 #=====CSV作成処理=====
+# ファイルを経由せずメモリ上に書き出し、そのままdiscordに渡せるファイルを返す
+# 大きくなった場合だけSpooledTemporaryFileがディスクに逃がす
+CSV_SPOOL_THRESHOLD = 8 * 1024 * 1024
+
 def make_csv(filename, rows, meta=None, header=None):
-    print("[start: make_csv]")
-    with open(filename, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.writer(f)
+    log.debug("[start: make_csv]")
+    writer = CsvBuffer(meta, header)
+    # rowsの書込
+    writer.writerows(rows)
+    return discord.File(writer.close(), filename=filename)
+
+#=====CSVの逐次書き出し=====
+# 行を受け取るたびにバッファへ書き込む(全行をリストに溜めない)
+class CsvBuffer:
+    # クラスの初期設定
+    def __init__(self, meta=None, header=None):
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_THRESHOLD)
+        self.text = io.TextIOWrapper(self.buffer, newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.text)
+        self.rows = 0
         # metaの書込
         if meta:
             for key, value in meta.items():
-                writer.writerow([f"#{key}: {value}"])
+                self.writer.writerow([f"#{key}: {value}"])
         # headerの書込
         if header:
-            writer.writerow(header)
-        # rowsの書込
-        writer.writerows(rows)
+            self.writer.writerow(header)
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        self.rows += 1
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    # 文字列層だけ外してバッファは開いたまま先頭に戻して返す
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        self.buffer.seek(0)
+        return self.buffer
+
+#=====アップロード上限に合わせたファイル化=====
+# 上限を超える場合はgzip圧縮し、それでも超える場合は上限ごとに分割する(結合: cat 名前.gz.* > 名前.gz)
+UPLOAD_MARGIN = 64 * 1024
+
+def fit_upload(buffer, filename, limit):
+    limit -= UPLOAD_MARGIN
+    size = buffer.seek(0, io.SEEK_END)
+    buffer.seek(0)
+    if size <= limit:
+        return [discord.File(buffer, filename=filename)]
+
+    # gzip圧縮
+    compressed = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_THRESHOLD)
+    with gzip.GzipFile(filename=filename, mode="wb", fileobj=compressed) as gz:
+        shutil.copyfileobj(buffer, gz)
+    buffer.close()
+    size = compressed.tell()
+    compressed.seek(0)
+    log.info("compressed export: %s (%s bytes)", filename, size)
+    if size <= limit:
+        return [discord.File(compressed, filename=f"{filename}.gz")]
+
+    # 分割
+    files = []
+    while True:
+        part = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_THRESHOLD)
+        remaining = limit
+        while remaining > 0:
+            data = compressed.read(min(remaining, 1024 * 1024))
+            if not data:
+                break
+            part.write(data)
+            remaining -= len(data)
+        if part.tell() == 0:
+            part.close()
+            break
+        part.seek(0)
+        files.append(discord.File(part, filename=f"{filename}.gz.{len(files) + 1:03d}"))
+    compressed.close()
+    return files
 
 #=====範囲を指定してメッセージのリストを作成=====
 async def collect_message(channel, counts=None, minutes=None):
@@ -531,16 +1660,107 @@ async def collect_message(channel, counts=None, minutes=None):
 
     return messages
 
-#=====一時ファイルの削除=====
-def remove_tmp_file(filename: str):
-    try:
-        if filename and os.path.exists(filename):
-            os.remove(filename)
-            print(f"removed: {filename}")
-        else:
-            print(f"error: file not found")
-    except Exception as e:
-        print(f"error deleting: {filename}: {e}")
+#=====メンバー表示名=====
+def member_display_name(member):
+    if member is None:
+        return "Unknown"
+    return getattr(member, "nick", None) or member.display_name or member.name
+
+#=====メンバー表示名の解決=====
+# (サーバーid, ユーザーid) -> 表示名などをLRU+TTLで保持し、on_member_updateで無効化する
+# キャッシュにないidはメンバーキャッシュを見て、それでもなければquery_members(1回100人まで)でまとめて取得する
+MEMBER_NAME_CACHE_SIZE = int(os.getenv("MEMBER_NAME_CACHE_SIZE", "10000"))
+MEMBER_NAME_TTL = float(os.getenv("MEMBER_NAME_TTL", "600"))
+
+class MemberNameResolver:
+    # クラスの初期設定
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # (サーバーid, ユーザーid) -> {"name", "bot", "expires"}
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.queried = 0
+
+    # メンバーをキャッシュに登録して{"name", "bot"}を返す
+    # Userはサーバーのニックネームを持たないので、キャッシュせずに返す
+    def remember(self, guild_id, member):
+        if not isinstance(member, discord.Member):
+            return {"name": member_display_name(member), "bot": bool(getattr(member, "bot", False))}
+        entry = {
+            "name": member_display_name(member),
+            "bot": bool(getattr(member, "bot", False)),
+            "expires": time.monotonic() + self.ttl
+        }
+        self.cache[(guild_id, member.id)] = entry
+        self.cache.move_to_end((guild_id, member.id))
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return entry
+
+    # キャッシュから取得(期限切れは削除)
+    def lookup(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return entry
+
+    # 名前が変わったメンバーを無効化
+    def invalidate(self, guild_id, user_id):
+        self.cache.pop((guild_id, user_id), None)
+
+    # 複数のidをまとめて解決して{ユーザーid: {"name", "bot"}}を返す
+    async def resolve(self, guild, user_ids):
+        entries = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            entry = self.lookup(guild.id, user_id)
+            if entry:
+                self.hits += 1
+                entries[user_id] = entry
+                continue
+            self.misses += 1
+            member = guild.get_member(user_id)
+            if member:
+                entries[user_id] = self.remember(guild.id, member)
+            else:
+                missing.append(user_id)
+        for i in range(0, len(missing), 100):
+            chunk = missing[i:i + 100]
+            self.queried += len(chunk)
+            try:
+                for member in await guild.query_members(user_ids=chunk, cache=True):
+                    entries[member.id] = self.remember(guild.id, member)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                log.warning("query_members error: %s", e)
+        # 退出済みなどで見つからなければユーザーを使う(キャッシュしない)
+        for user_id in missing:
+            if user_id not in entries:
+                user = bot.get_user(user_id)
+                entries[user_id] = {"name": member_display_name(user), "bot": bool(user and user.bot)}
+        if missing:
+            log.debug("member names: %s", self.stats())
+        return entries
+
+    # 複数のidの表示名
+    async def names(self, guild, user_ids):
+        return {user_id: entry["name"] for user_id, entry in (await self.resolve(guild, user_ids)).items()}
+
+    # 1人分の表示名
+    async def name(self, guild, user_id):
+        return (await self.names(guild, [user_id]))[user_id]
+
+    # キャッシュの統計
+    def stats(self):
+        return {"size": len(self.cache), "hits": self.hits, "misses": self.misses, "queried": self.queried}
+
+member_names = MemberNameResolver(MEMBER_NAME_CACHE_SIZE, MEMBER_NAME_TTL)
 
 #===============
 # 個別処理関数
@@ -555,50 +1775,74 @@ async def handle_remove_reminder(interaction, guild_id, dt, idx):
         # 削除完了メッセージの送信
         await interaction.message.delete()
         await interaction.followup.send(
-            content=f"リマインダーを削除したよ🫡: {dt.strftime('%Y/%m/%d %H:%M')} - {removed['msg']}",
+            content=f"リマインダーを削除したよ🫡: {format_reminder_dt(dt)} - {removed['msg']}",
             allowed_mentions=discord.AllowedMentions.none(),
             ephemeral=True
         )
 
+#=====リマインダー日時の変換=====
+# 時刻は秒まで指定可能(hh:mm または hh:mm:ss)
+def parse_reminder_dt(date, time_str):
+    for fmt in ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M"):
+        try:
+            return datetime.strptime(f"{date} {time_str}", fmt).replace(tzinfo=JST)
+        except ValueError:
+            continue
+    raise ValueError(f"invalid reminder datetime: {date} {time_str}")
+
+#=====リマインダー日時の表示=====
+# 秒が指定されている場合だけ秒まで表示する
+def format_reminder_dt(dt):
+    return dt.strftime("%Y/%m/%d %H:%M:%S" if dt.second else "%Y/%m/%d %H:%M")
+
+#=====繰り返し条件の表示=====
+# 一覧に表示する今後の回の件数
+REMINDER_LIST_OCCURRENCES = 3
+REPEAT_LABELS = {"day": "日", "hour": "時間", "minute": "分"}
+
+def format_repeat_rule(rmd_dt):
+    text = f"{max(rmd_dt['interval'], 1)}{REPEAT_LABELS[rmd_dt['repeat']]}ごと"
+    if rmd_dt["count"]:
+        text += f" / {rmd_dt['count']}回まで"
+    if rmd_dt["until"]:
+        text += f" / {rmd_dt['until'].strftime('%Y/%m/%d')}まで"
+    return text
+
+#=====リマインダー通知=====
+# 送信はディスパッチャに任せ、繰り返し予定は次回日時をスケジューラに積み直すだけにする
+# ストレージに書き込むのは終了した予定の削除だけ(通知1回分をまとめて登録)
+def fire_reminders(due):
+    now = datetime.now(JST)
+    removed_ids = []
+    for guild_id, dt, occurrence, rmd_dt in due:
+        rid = rmd_dt["id"]
+        if occurrence:
+            dispatcher.dispatch(rmd_dt["channel_id"], occurrence, rmd_dt["msg"])
+            scheduler.cursors[rid] = occurrence
+            next_dt = scheduler.next_fire(dt, rmd_dt, now)
+            if next_dt:
+                scheduler.push(guild_id, dt, rid, next_dt)
+                continue
+        # 単発の予定と終了した繰り返し予定は削除
+        detach_reminder(guild_id, dt, rid)
+        scheduler.cursors.pop(rid, None)
+        removed_ids.append(rid)
+    # 複数サーバーにまたがるので1件の書込としてまとめて登録
+    if removed_ids:
+        persister.submit(None, repository.remove_reminders, removed_ids)
+
 #=====通知用ループ処理=====
+# 次の予定の時刻まで待機し、時刻を過ぎた予定だけを通知する
 async def reminder_loop():
     await bot.wait_until_ready()
     while not bot.is_closed():
-        # 現在時刻を取得して次のゼロ秒までsleep
-        now = datetime.now(JST)
-        next_minute = (now + timedelta(minutes=1)).replace(second=0, microsecond=0)
-        wait = (next_minute - now).total_seconds()
-        await asyncio.sleep(wait)
-
-        for guild_id in all_data:
-            reminders = all_data[guild_id]["reminders"]
-            # 辞書に該当時刻が登録されていた場合
-            if next_minute in reminders:
-                # 該当行を取り出してラベル付きリストに代入し値を取り出す
-                for rmd_dt in reminders[next_minute]:
-                    channel_id = rmd_dt["channel_id"]
-                    repeat = rmd_dt["repeat"]
-                    interval = rmd_dt["interval"]
-                    msg = rmd_dt["msg"]
-                    channel = bot.get_channel(channel_id)
-                    if channel:
-                        await channel.send(f"{msg}")
-                        print (f"チャンネルにメッセージを送信: {datetime.now(JST)}")
-                    else:
-                        print(f"チャンネル取得失敗: {channel_id}")
-                
-                    # 繰り返し予定の登録
-                    if repeat:
-                        if repeat == "day":
-                            dt = next_minute + timedelta(days=interval)
-                        elif repeat == "hour":
-                            dt = next_minute + timedelta(hours=interval)
-                        elif repeat == "minute":
-                            dt = next_minute + timedelta(minutes=interval)
-                        add_reminder(guild_id, dt, repeat, interval, channel_id, msg)
-                
-                # 処理済の予定の削除
-                remove_reminder(guild_id, next_minute)
+        due = scheduler.pop_due(time.time())
+        if due:
+            fire_reminders(due)
+            # 遅延の統計は並べ替えを伴うのでDEBUGのときだけ計算する
+            if reminder_log.isEnabledFor(logging.DEBUG):
+                reminder_log.debug("dispatched: %s reminders, %s", len(due), dispatcher.lag_stats())
+        await scheduler.wait(time.time())
 
 #---------------
 # 投票関係
@@ -631,82 +1875,293 @@ def reaction_replace(options, reactions):
     return options, reactions
 
 #=====投票選択肢embed作成=====
-def make_poll_embed(options, reactions, question, description):
+def make_poll_embed(options, reactions, question, description, counts=None):
     for i, opt in enumerate(options):
         if opt:
-            description += f"{reactions[i]} {opt}\n"
+            description += f"{reactions[i]} {opt}"
+            # ライブ表示の場合は現在の票数を付ける
+            if counts is not None:
+                description += f" - **{counts[i]}**人"
+            description += "\n"
     embed = discord.Embed(title=question, description=description, color=discord.Color.green())
     return embed
 
+#=====リアクションしたユーザーの並行取得=====
+# リアクションごとのユーザー一覧を同時実行数を制限して並行に取得する(結果はリアクション順)
+REACTION_FETCH_CONCURRENCY = 4
+
+async def fetch_reaction_users(reactions):
+    semaphore = asyncio.Semaphore(REACTION_FETCH_CONCURRENCY)
+    async def fetch(reaction):
+        async with semaphore:
+            return [user async for user in reaction.users() if user.id != bot.user.id]
+    return await asyncio.gather(*(fetch(reaction) for reaction in reactions))
+
+#=====リアクション集計(ライブ)=====
+# 登録済みの投票について、絵文字ごとにリアクションしたユーザーidを登録順に保持する
+# 生のリアクションイベントで更新し、起動後に初めて集計するときだけメッセージから照合する
+class VoteTally:
+    # クラスの初期設定
+    def __init__(self):
+        # msg_id -> {絵文字: {ユーザーid: None}}
+        self.tallies = {}
+        # 照合中に届いたイベント(照合後に反映する)
+        self.pending = {}
+        # 実行中の照合(1つのメッセージにつき1つだけ)
+        self.reconciling = {}
+
+    # リアクション追加を反映(照合済みの投票だけ)
+    def add(self, msg_id, emoji, user_id):
+        if msg_id in self.pending:
+            self.pending[msg_id].append((self.add, emoji, user_id))
+        elif msg_id in self.tallies:
+            self.tallies[msg_id].setdefault(emoji, {})[user_id] = None
+
+    # リアクション削除を反映(照合済みの投票だけ)
+    def remove(self, msg_id, emoji, user_id):
+        if msg_id in self.pending:
+            self.pending[msg_id].append((self.remove, emoji, user_id))
+        elif msg_id in self.tallies:
+            self.tallies[msg_id].get(emoji, {}).pop(user_id, None)
+
+    # 絵文字単位のリアクション一括削除
+    def clear_emoji(self, msg_id, emoji):
+        if msg_id in self.pending:
+            self.pending[msg_id].append((self.clear_emoji, emoji))
+        elif msg_id in self.tallies:
+            self.tallies[msg_id].pop(emoji, None)
+
+    # 集計を破棄(次回集計時に照合し直す)
+    def forget(self, msg_id):
+        if msg_id in self.pending:
+            self.pending[msg_id].append((self.forget,))
+        self.tallies.pop(msg_id, None)
+
+    # 作成直後の投票を空の集計から追跡(照合不要)
+    def track(self, msg_id):
+        self.tallies.setdefault(msg_id, {})
+
+    # メッセージを取得してリアクションを全件照合(イベントは開始時点から溜めておく)
+    async def reconcile(self, channel, msg_id):
+        try:
+            message = await channel.fetch_message(msg_id)
+            users_list = await fetch_reaction_users(message.reactions)
+        except BaseException:
+            # 集計がないままなので溜めたイベントは捨てる(次回の照合で取り込まれる)
+            dropped = self.pending.pop(msg_id, [])
+            vote_log.warning("reconcile failed: %s (%s events dropped)", msg_id, len(dropped))
+            raise
+        tally = {
+            str(reaction.emoji): {user.id: None for user in users}
+            for reaction, users in zip(message.reactions, users_list)
+        }
+        self.tallies[msg_id] = tally
+        events = self.pending.pop(msg_id, [])
+        for apply, *args in events:
+            apply(msg_id, *args)
+        vote_log.info("reconciled tally: %s (%s reactions, %s events)", msg_id, len(tally), len(events))
+        return tally
+
+    # 照合済みなら保持している集計、未照合ならメッセージから照合して返す
+    # 同時に呼ばれても照合は1回だけ行い、結果を共有する
+    async def get(self, channel, msg_id):
+        tally = self.tallies.get(msg_id)
+        if tally is not None:
+            return tally
+        task = self.reconciling.get(msg_id)
+        if task is None:
+            self.pending[msg_id] = []
+            task = asyncio.ensure_future(self.reconcile(channel, msg_id))
+            self.reconciling[msg_id] = task
+            task.add_done_callback(lambda _: self.reconciling.pop(msg_id, None))
+        # 呼び出し元のキャンセルで照合自体は止めない
+        return await asyncio.shield(task)
+
+    # 保持している集計を捨ててメッセージから照合し直す(最終結果など取りこぼせない集計用)
+    # 照合中ならその結果を使う
+    async def refresh(self, channel, msg_id):
+        if msg_id not in self.reconciling:
+            self.tallies.pop(msg_id, None)
+        return await self.get(channel, msg_id)
+
+    # 全ての集計を破棄(セッションを再開できずに再接続した場合、切断中のリアクションが届かないため)
+    def reset(self):
+        self.tallies.clear()
+
+vote_tally = VoteTally()
+
+#=====投票のライブ表示=====
+# ライブ表示の投票は、リアクションなどの変化をまとめて最短LIVE_POLL_INTERVAL秒に1回だけembedを書き換える
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "5"))
+
+#---現在の票数を付けた投票embed---
+def make_live_poll_embed(guild_id, msg_id, tally):
+    vote = all_data[guild_id]["votes"][msg_id]
+    records = all_data[guild_id]["proxy_votes"].get(msg_id, {})
+    counts = [
+        len(tally.get(reaction, {})) + len(proxy_index.voters_by_option(msg_id, records, i))
+        for i, reaction in enumerate(vote["reactions"])
+    ]
+    embed = make_poll_embed(vote["options"], vote["reactions"], vote["question"], "", counts)
+    embed.set_footer(text=f"ライブ集計 - {datetime.now(JST).strftime('%Y/%m/%d %H:%M:%S')}")
+    return embed
+
+class LivePollUpdater:
+    # クラスの初期設定
+    def __init__(self, interval):
+        self.interval = interval
+        # 書き換え予約(msg_id -> TimerHandle)
+        self.pending = {}
+        # 最後に書き換えた時刻
+        self.last_edit = {}
+        self.tasks = set()
+
+    # ライブ表示の投票か
+    def is_live(self, guild_id, msg_id):
+        if guild_id not in all_data.guild_ids:
+            return False
+        return all_data[guild_id]["votes"].get(msg_id, {}).get("live", False)
+
+    # 変化を記録して書き換えを予約(予約済みなら次の書き換えにまとめる)
+    def mark(self, guild_id, channel_id, msg_id):
+        if not self.is_live(guild_id, msg_id):
+            return
+        # チャンネルidを保存していない投票はイベントのチャンネルidを登録
+        vote = all_data[guild_id]["votes"][msg_id]
+        if vote["channel_id"] is None:
+            vote["channel_id"] = channel_id
+            persister.submit(
+                guild_id, repository.upsert_vote, guild_id, msg_id, vote["question"], list(vote["reactions"]), list(vote["options"]), True, channel_id
+            )
+        if msg_id in self.pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = max(0, self.last_edit.get(msg_id, 0) + self.interval - time.monotonic())
+        self.pending[msg_id] = loop.call_later(delay, self.start_edit, guild_id, msg_id)
+
+    # 保存したチャンネルの投票の書き換えを予約(代理投票の変更時など)
+    def touch(self, guild_id, msg_id):
+        if self.is_live(guild_id, msg_id):
+            channel_id = all_data[guild_id]["votes"][msg_id]["channel_id"]
+            if channel_id is not None:
+                self.mark(guild_id, channel_id, msg_id)
+
+    def start_edit(self, guild_id, msg_id):
+        task = asyncio.ensure_future(self.edit(guild_id, msg_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    # embedを書き換え(書き換え中の変化は次の予約にまとめる)
+    async def edit(self, guild_id, msg_id):
+        self.pending.pop(msg_id, None)
+        self.last_edit[msg_id] = time.monotonic()
+        if not self.is_live(guild_id, msg_id):
+            return
+        try:
+            channel_id = all_data[guild_id]["votes"][msg_id]["channel_id"]
+            channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+            tally = await vote_tally.get(channel, msg_id)
+            await channel.get_partial_message(msg_id).edit(embed=make_live_poll_embed(guild_id, msg_id, tally))
+            vote_log.debug("live poll updated: %s", msg_id)
+        except discord.HTTPException as e:
+            vote_log.warning("live poll update error: %s: %s", msg_id, e)
+
+    # 投票の削除時に予約を取り消す
+    def forget(self, msg_id):
+        handle = self.pending.pop(msg_id, None)
+        if handle:
+            handle.cancel()
+        self.last_edit.pop(msg_id, None)
+
+live_polls = LivePollUpdater(LIVE_POLL_INTERVAL)
+
+# ストレージが空でjson(旧形式またはスナップショット)があれば一度だけ取り込む
+# ジャーナルの再生で投票の集計やライブ表示の処理を呼ぶので、それらの定義後に行う
+if repository.is_empty() and os.path.exists(LEGACY_JSON_PATH):
+    import_json_data()
+
 #=====投票集計=====
-async def make_vote_result(interaction, msg_id):
-    print("[start: make_vote_result]")
+# リアクションの取得、代理人を含むメンバーの一括取得、結果の組み立ての順に行う
+# refresh=Trueなら保持している集計を使わずにメッセージから照合し直す
+async def make_vote_result(interaction, msg_id, refresh=False):
+    vote_log.debug("[start: make_vote_result]")
     votes = all_data[interaction.guild.id]["votes"]
     proxy_votes = all_data[interaction.guild.id]["proxy_votes"]
-    # 投票辞書を読み込み
+    # サーバー情報を読み込み
+    guild = interaction.guild
+
+    # 選択肢ごとの(絵文字, リアクションしたユーザー)を作成
     if msg_id in votes:
+        # 登録済みの投票は保持している集計を使う(メッセージの再取得はしない)
         options = votes[msg_id]["options"]
-        print(f"votes: {votes}")
+        vote_log.debug("vote: %s", votes.get(msg_id))
+        if refresh:
+            tally = await vote_tally.refresh(interaction.channel, msg_id)
+        else:
+            tally = await vote_tally.get(interaction.channel, msg_id)
+        entries = [(reaction, list(tally.get(reaction, {}))) for reaction in votes[msg_id]["reactions"]]
     else:
+        # 登録外のメッセージはリアクションをその都度並行に取得
         options = []
-    # メッセージを読み込み
-    message = await interaction.channel.fetch_message(msg_id)
-    # サーバー情報を読み込み
-    guild = interaction.guild
-    
+        message = await interaction.channel.fetch_message(msg_id)
+        users_list = await fetch_reaction_users(message.reactions)
+        entries = [
+            (reaction.emoji, [user.id for user in users])
+            for reaction, users in zip(message.reactions, users_list)
+        ]
+        # 取得済みのメンバーはキャッシュに登録(Userはニックネームを持たないので登録しない)
+        for users in users_list:
+            for user in users:
+                if isinstance(user, discord.Member):
+                    member_names.remember(guild.id, user)
+
+    # 代理投票分(選択肢ごとに(投票者, 代理人id)を索引から並べる)
+    records = proxy_votes.get(msg_id, {})
+    proxies = {
+        i: [(voter, records[voter]["agent_id"]) for voter in proxy_index.voters_by_option(msg_id, records, i)]
+        for i in range(len(entries))
+    }
+
+    # 表示名が必要なメンバーをまとめて解決
+    user_ids = [user_id for _, ids in entries for user_id in ids]
+    agent_ids = [agent_id for values in proxies.values() for _, agent_id in values]
+    names = await member_names.names(guild, user_ids + agent_ids)
+
     # 結果用辞書を準備
     result = {}
     # 結果用辞書に結果を記録
-    for i, reaction in enumerate(message.reactions):
-        
-        # リアクション投票分
-        # リアクションしたユーザーがbotでなければリストに追加
-        reaction_users = [reaction_user async for reaction_user in reaction.users() if reaction_user != bot.user]
-        users = [user.nick or user.display_name or user.name for user in reaction_users]
-        
-        # 代理投票分
-        if msg_id in proxy_votes:
-            # 投票者の投票内容を確認し該当する選択肢のものがあればリストに追加
-            for voter, values in proxy_votes[msg_id].items():
-                for opt_idx in values["opt_idx"]:
-                    if opt_idx == i:
-                        agent_id = values["agent_id"]
-                        # 代理人のidから代理人を検索
-                        agent = guild.get_member(agent_id)
-                        # 代理人が最近のキャッシュに見つからなければサーバー情報から検索
-                        if agent is None:
-                            try:
-                                agent = await guild.fetch_member(agent_id)
-                            # それでも見つからない場合はNoneを表示
-                            except:
-                                agent = None
-                        if agent:
-                            agent_display_name = agent.nick or agent.display_name or agent.name
-                        else:
-                            agent_display_name = "Unknown"
-
-                        users.append(f"{voter}(by:{agent_display_name})")
+    for i, (reaction_emoji, ids) in enumerate(entries):
+        users = [names[user_id] for user_id in ids]
+        users += [f"{voter}(by:{names[agent_id]})" for voter, agent_id in proxies.get(i, [])]
+        # アーカイブ用の(ユーザーid, 名前, 代理人id)
+        ballots = [(user_id, names[user_id], None) for user_id in ids]
+        ballots += [(None, voter, agent_id) for voter, agent_id in proxies.get(i, [])]
 
         if options:
             result[i] = {
-                "emoji": reaction.emoji,
+                "emoji": reaction_emoji,
                 "option": options[i],
                 "count": len(users),
                 "users": users,
+                "ballots": ballots,
             }
         else:
             result[i] = {
-                "emoji": reaction.emoji,
+                "emoji": reaction_emoji,
                 "option": f"選択肢[{i+1}]",
                 "count": len(users),
                 "users": users,
+                "ballots": ballots,
             }
     dt = datetime.now(JST)
     return dt, result
 
 #=====投票結果表示=====
 async def show_vote_result(interaction, dt, result, msg_id, mode):
-    print("[start: show_vote_result]")
+    vote_log.debug("[start: show_vote_result]")
     votes = all_data[interaction.guild.id]["votes"]
     # Embedの設定
     if msg_id in votes:
@@ -756,7 +2211,7 @@ async def show_vote_result(interaction, dt, result, msg_id, mode):
 
 #=====投票結果rows作成処理(選択肢グループ)=====
 def make_grouped_rows(result):
-    print("[start: make_grouprd_rows]")
+    vote_log.debug("[start: make_grouped_rows]")
     # 空のリストを用意
     header = []
     rows = []
@@ -787,7 +2242,7 @@ def make_grouped_rows(result):
 
 #=====投票結果rows作成処理(一覧)=====
 def make_listed_rows(result):
-    print("[start: make_listed_rows]")
+    vote_log.debug("[start: make_listed_rows]")
     header = ["option", "users"]
     
     rows = [
@@ -800,7 +2255,7 @@ def make_listed_rows(result):
 
 #=====投票結果CSV出力処理=====
 async def export_vote_csv(interaction, result, msg_id, dt, mode):
-    print("[start: export_vote_csv]")
+    vote_log.debug("[start: export_vote_csv]")
     votes = all_data[interaction.guild.id]["votes"]
     if msg_id in votes:
         meta = {
@@ -813,44 +2268,197 @@ async def export_vote_csv(interaction, result, msg_id, dt, mode):
     
     # csv(グループ型)の作成
     header, rows = make_grouped_rows(result)
-    grouped_file = f"./tmp/{dt.strftime('%Y%m%d_%H%M')}_grouped.csv"
-    make_csv(grouped_file, rows, meta, header)
+    grouped_file = make_csv(f"{dt.strftime('%Y%m%d_%H%M')}_grouped.csv", rows, meta, header)
     
     # csv(リスト型)の作成
     header, rows = make_listed_rows(result)
-    listed_file = f"./tmp/{dt.strftime('%Y%m%d_%H%M')}_listed.csv"
-    make_csv(listed_file, rows, meta, header)
+    listed_file = make_csv(f"{dt.strftime('%Y%m%d_%H%M')}_listed.csv", rows, meta, header)
     
     # discordに送信
     await interaction.followup.send(
         content="投票集計結果のCSVだよ🫡",
-        files=[discord.File(grouped_file), discord.File(listed_file)]
+        files=[grouped_file, listed_file]
     )
-    
-    # 一時ファイルを削除
-    remove_tmp_file(grouped_file)
-    remove_tmp_file(listed_file)
 
 #---------------
 # OCR関係
 #---------------
-#=====添付画像バイナリ取得処理=====
-async def get_image(channel, message):
-    print("[start: get_image]")
-    
-    # 添付画像がなければNoneを返す
-    if not message.attachments:
-        return None
+# 画像ダウンロードの同時実行数
+OCR_DOWNLOAD_CONCURRENCY = int(os.getenv("OCR_DOWNLOAD_CONCURRENCY", "4"))
+# Vision APIの同時実行数(専用スレッド数)
+OCR_VISION_CONCURRENCY = int(os.getenv("OCR_VISION_CONCURRENCY", "4"))
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_VISION_CONCURRENCY, thread_name_prefix="vision")
+# 指定するとVision APIのレスポンスをjsonで保存する(check_ocr_parity.pyでの照合用)
+OCR_RECORD_DIR = os.getenv("OCR_RECORD_DIR")
+# Vision APIの1リクエストにまとめる画像の枚数と合計サイズの上限
+OCR_BATCH_MAX_IMAGES = int(os.getenv("OCR_BATCH_MAX_IMAGES", "16"))
+OCR_BATCH_MAX_BYTES = int(os.getenv("OCR_BATCH_MAX_BYTES", str(8 * 1024 * 1024)))
+
+#=====OCR結果キャッシュ=====
+# 画像バイトのSHA-256と抽出条件をキーに、表の抽出結果(行リスト)をディスクに保持する
+# 合計サイズが上限を超えたら最後に使ってから最も古いものから削除する(LRU)
+OCR_CACHE_PATH = "./data/ocr_cache.db"
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 表の抽出処理を変えたら上げる(古い抽出結果を使わないようにキーに含める)
+OCR_ENGINE_VERSION = 1
+# 表の再構成の単位(symbol: 文字単位, word: Visionの単語単位)
+OCR_UNITS = ("symbol", "word")
+OCR_DEFAULT_UNIT = os.getenv("OCR_DEFAULT_UNIT", "symbol")
+if OCR_DEFAULT_UNIT not in OCR_UNITS:
+    ocr_log.warning("unknown OCR_DEFAULT_UNIT: %s (use symbol)", OCR_DEFAULT_UNIT)
+    OCR_DEFAULT_UNIT = "symbol"
+# 単語単位で、前の単語の右端から次の単語の左端までがこの倍率×文字の高さ未満なら同じ項目として連結
+OCR_WORD_GAP_RATIO = float(os.getenv("OCR_WORD_GAP_RATIO", "1.0"))
+
+class OcrResultCache:
+    # クラスの初期設定
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        # Visionスレッドから使うため接続はロックで守る
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, rows TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    # 画像と抽出条件からキーを作成
+    def key(self, content, *params):
+        return ":".join([hashlib.sha256(content).hexdigest(), *map(str, params)])
+
+    # キャッシュ済みの結果をまとめて取得(key -> rows)
+    def get_many(self, keys):
+        with self.lock:
+            placeholders = ",".join("?" * len(keys))
+            found = {
+                key: json.loads(rows)
+                for key, rows in self.conn.execute(f"SELECT key, rows FROM ocr_cache WHERE key IN ({placeholders})", tuple(keys))
+            }
+            if found:
+                with self.conn:
+                    self.conn.executemany("UPDATE ocr_cache SET last_used = ? WHERE key = ?", [(time.time(), key) for key in found])
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    # 結果を登録して上限を超えた分を削除
+    def put_many(self, entries):
+        with self.lock, self.conn:
+            for key, rows in entries.items():
+                text = json.dumps(rows, ensure_ascii=False)
+                size = len(key) + len(text.encode("utf-8"))
+                old = self.conn.execute("SELECT size FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO ocr_cache (key, rows, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, text, size, time.time())
+                )
+                self.size += size - (old[0] if old else 0)
+            while self.size > self.max_bytes:
+                oldest = self.conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_used LIMIT 100").fetchall()
+                if not oldest:
+                    break
+                for key, size in oldest:
+                    if self.size <= self.max_bytes:
+                        break
+                    self.conn.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+                    self.size -= size
+                    self.evicted += 1
+
+    # キャッシュの統計
+    def stats(self):
+        return {"bytes": self.size, "hits": self.hits, "misses": self.misses, "evicted": self.evicted}
+
+ocr_cache = OcrResultCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES)
+
+#=====HTTPセッション(共有)=====
+# 呼び出しごとにセッションを作らず、接続プールを使い回す(イベントループ上で初回に生成)
+class SharedHttpSession:
+    # クラスの初期設定
+    def __init__(self, limit):
+        self.limit = limit
+        self.session = None
 
-    # 画像データをcontentsに格納
-    contents = []
-    async with aiohttp.ClientSession() as session:
-        for attachment in message.attachments:
-            async with session.get(attachment.url) as resp:
-                content = await resp.read()
-                contents.append(content)
+    def get(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit))
+        return self.session
 
-    return contents
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+http_session = SharedHttpSession(OCR_DOWNLOAD_CONCURRENCY * 2)
+
+#=====添付画像バイナリ取得処理=====
+async def get_image(attachment):
+    ocr_log.debug("[start: get_image]")
+    async with http_session.get().get(attachment.url) as resp:
+        resp.raise_for_status()
+        return await resp.read()
+
+#=====添付画像をまとめ要求の単位に分ける=====
+# 添付の順を保ったまま、枚数と合計サイズ(ダウンロード前に分かるattachment.size)の上限で区切る
+def group_attachments(attachments, max_images=OCR_BATCH_MAX_IMAGES, max_bytes=OCR_BATCH_MAX_BYTES):
+    groups = []
+    current = []
+    size = 0
+    for attachment in attachments:
+        if current and (len(current) >= max_images or size + attachment.size > max_bytes):
+            groups.append(current)
+            current = []
+            size = 0
+        current.append(attachment)
+        size += attachment.size
+    if current:
+        groups.append(current)
+    return groups
+
+#=====添付画像のOCR=====
+# まとめ要求の単位ごとにダウンロードとVision APIを並行して流し、結果は添付の順に連結する
+# キャッシュにある画像はVision APIにも表の抽出にも回さない
+async def ocr_attachments(attachments, unit=OCR_DEFAULT_UNIT):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(OCR_DOWNLOAD_CONCURRENCY)
+    requests = 0
+    async def download(attachment):
+        async with semaphore:
+            return await get_image(attachment)
+    async def ocr(group):
+        nonlocal requests
+        contents = await asyncio.gather(*(download(attachment) for attachment in group))
+        # 単語単位の行はOCR_WORD_GAP_RATIOにもよるのでキーに含める
+        params = ("document", unit, OCR_ENGINE_VERSION) + ((OCR_WORD_GAP_RATIO,) if unit == "word" else ())
+        keys = [ocr_cache.key(content, *params) for content in contents]
+        tables = await loop.run_in_executor(ocr_executor, ocr_cache.get_many, keys)
+        misses = {key: content for key, content in zip(keys, contents) if key not in tables}
+        if misses:
+            requests += 1
+            responses = await detect_documents(list(misses.values()))
+            # 表の抽出もイベントループを止めないようにOCR用のスレッドで行う
+            def extract():
+                return [extract_table_from_response(response, unit) for response in responses]
+            extracted = await loop.run_in_executor(ocr_executor, extract)
+            # エラーになった画像は次回やり直せるようにキャッシュしない
+            results = {}
+            for key, response, rows in zip(misses, responses, extracted):
+                tables[key] = rows
+                if not response.error.message:
+                    results[key] = rows
+            await loop.run_in_executor(ocr_executor, ocr_cache.put_many, results)
+        return [tables[key] for key in keys]
+    groups = group_attachments(attachments)
+    results = await asyncio.gather(*(ocr(group) for group in groups))
+    ocr_log.info("ocr: %s images in %s requests (%s), cache: %s", len(attachments), requests, unit, ocr_cache.stats())
+    return [row for tables in results for rows in tables for row in rows]
 
 #=====文字座標計算=====
 #---行センター出し関数---
@@ -867,7 +2475,7 @@ def get_height(bounding_box):
 
 #=====symbol取得処理=====
 def get_symbols(response):
-    print("[start: get_symbols]")
+    ocr_log.debug("[start: get_symbols]")
     symbols = [{
             "symbol": symbol.text,
             "x": get_x_center(symbol.bounding_box),
@@ -885,7 +2493,7 @@ def get_symbols(response):
 #=====同一行列判定=====
 #---行作成処理---
 def cluster_lines(symbols, avr_height):
-    print("[start: cluster_lines]")
+    ocr_log.debug("[start: cluster_lines]")
     # symbolをy座標でソート
     symbols.sort(key=lambda symbol: symbol["y"])
     # y座標で同一行を判定
@@ -914,7 +2522,7 @@ def cluster_lines(symbols, avr_height):
 
 #---列項目作成処理---
 def cluster_rows(lines, avr_height):
-    print("[start: cluster_rows]")
+    ocr_log.debug("[start: cluster_rows]")
     # x座標で単語を判定
     word = []
     row = []
@@ -944,28 +2552,177 @@ def cluster_rows(lines, avr_height):
 #---最頻列数を取得---
 def get_mode_columns(rows):
     col_counts = [len(row) for row in rows]
-    return max(set(col_counts), key=col_counts.count)
+    # 列数ごとの件数を先に数える(同数の場合の選ばれ方は従来どおり)
+    frequency = {}
+    for count in col_counts:
+        frequency[count] = frequency.get(count, 0) + 1
+    return max(set(col_counts), key=frequency.__getitem__)
 
 #---表本体抽出処理---
 def extract_table_body(rows):
-    print("[start: extract_table_body]")
+    ocr_log.debug("[start: extract_table_body]")
 
     mode_columns = get_mode_columns(rows)
     table_body = [row for row in rows if len(row) + 1 >= mode_columns]
     return table_body
 
-#=====OCR->CSV用データ作成処理=====
-async def extract_table_from_image(image_content):
-    print("[start: extract_table_from_image]")
+#=====Vision APIでの文字検出(まとめ要求)=====
+# 複数画像を1回のbatch_annotate_imagesで送り、画像の順にレスポンスを返す
+async def detect_documents(contents):
+    ocr_log.debug("[start: detect_documents]")
     loop = asyncio.get_running_loop()
-    image = vision.Image(content=image_content)
 
-    # Vision APIをスレッドで実行
-    response = await loop.run_in_executor(
-        None,
-        lambda: vision_client.document_text_detection(image=image)
-    )
+    # Vision APIを専用スレッドで実行(初回はクライアント生成もスレッド側で行う)
+    def detect():
+        vision_client = clients.get("vision")
+        from google.cloud import vision
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for content in contents
+        ]
+        responses = vision_client.batch_annotate_images(requests=requests).responses
+        if OCR_RECORD_DIR:
+            record_responses(contents, responses)
+        return responses
+
+    responses = await loop.run_in_executor(ocr_executor, detect)
+    # 画像単位のエラーはその画像だけ空の結果として扱う
+    for i, response in enumerate(responses):
+        if response.error.message:
+            ocr_log.warning("vision error: image %s: %s", i, response.error.message)
+    return responses
+
+#=====表の再構成(NumPy)=====
+# 文字の中心座標と高さを配列で持ち、行・単語の切れ目を並べ替えた配列の差分としきい値で求める
+# 出力はcluster_lines/cluster_rowsによる従来の処理と同じ(check_ocr_parity.pyで照合)
+
+#---文字と外接矩形の配列を取得---
+def get_symbol_arrays(response):
+    np = clients.get("numpy")
+    texts = []
+    # 頂点の座標を平たく並べてから(文字数, 頂点数, 2)の配列にする
+    coords = []
+    for page in response.full_text_annotation.pages:
+        for block in page.blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    for symbol in word.symbols:
+                        texts.append(symbol.text)
+                        for vertice in symbol.bounding_box.vertices:
+                            coords += (vertice.x, vertice.y)
+    if not texts:
+        return texts, None
+    return texts, np.array(coords, dtype=np.int64).reshape(len(texts), -1, 2)
+
+#---単語と外接矩形の配列を取得---
+# 文字の座標は読まず、単語の文字列と単語の外接矩形だけを使う
+def get_word_arrays(response):
+    np = clients.get("numpy")
+    texts = []
+    coords = []
+    for page in response.full_text_annotation.pages:
+        for block in page.blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    text = "".join(symbol.text for symbol in word.symbols)
+                    if not text:
+                        continue
+                    texts.append(text)
+                    for vertice in word.bounding_box.vertices:
+                        coords += (vertice.x, vertice.y)
+    if not texts:
+        return texts, None
+    return texts, np.array(coords, dtype=np.int64).reshape(len(texts), -1, 2)
+
+#---行番号の割り当て---
+# 行のy座標は追加した文字との平均で更新していくため、切れ目の判定だけは順に行う
+def assign_lines(sorted_y, avr_height):
+    np = clients.get("numpy")
+    line_ids = []
+    line_id = 0
+    line_y = sorted_y[0]
+    for y in sorted_y:
+        if abs(y - line_y) < avr_height:
+            line_y = (line_y + y) / 2
+        else:
+            line_id += 1
+            line_y = y
+        line_ids.append(line_id)
+    return np.array(line_ids, dtype=np.int64)
+
+#---表の行リストを作成---
+def build_table_rows(texts, boxes, unit="symbol"):
+    np = clients.get("numpy")
+    # 中心座標と高さ(従来の get_x_center / get_y_center / get_height と同じ計算)
+    xs = boxes[:, :, 0].sum(axis=1) / 4
+    ys = boxes[:, :, 1].sum(axis=1) / 4
+    heights = boxes[:, :, 1].max(axis=1) - boxes[:, :, 1].min(axis=1)
+    # 平均は従来と同じ順で合計して丸めを揃える
+    avr_height = sum(heights.tolist()) / len(texts)
+
+    # y座標順に並べて行を判定し、行ごとにx座標順に並べ替え(いずれも安定ソート)
+    by_y = np.argsort(ys, kind="stable")
+    line_ids = assign_lines(ys[by_y].tolist(), avr_height)
+    within_line = np.lexsort((xs[by_y], line_ids))
+    order = by_y[within_line]
+    line_ids = line_ids[within_line]
+    sorted_x = xs[order]
+
+    new_line = np.ones(len(order), dtype=bool)
+    new_line[1:] = line_ids[1:] != line_ids[:-1]
+    new_word = new_line.copy()
+    if unit == "word":
+        # 行の先頭、または直前の単語の右端からの隙間が文字の高さ×倍率以上なら項目の切れ目
+        lefts = boxes[order, :, 0].min(axis=1)
+        rights = boxes[order, :, 0].max(axis=1)
+        new_word[1:] |= ~(lefts[1:] - rights[:-1] < avr_height * OCR_WORD_GAP_RATIO)
+    else:
+        # 行の先頭、または直前の文字からの距離が文字の高さの2倍以上なら単語の切れ目
+        new_word[1:] |= ~(np.diff(sorted_x) < avr_height * 2)
 
+    # 単語ごとに文字を連結して行を作る
+    sorted_texts = [texts[i] for i in order.tolist()]
+    word_starts = np.flatnonzero(new_word).tolist()
+    word_ends = word_starts[1:] + [len(order)]
+    rows = []
+    for start, end, line_start in zip(word_starts, word_ends, new_line[word_starts].tolist()):
+        if line_start:
+            rows.append([])
+        rows[-1].append("".join(sorted_texts[start:end]))
+    # 文字の高さが0の場合、従来の処理は行頭に空の項目が入る
+    if unit == "symbol" and not 0 < avr_height * 2:
+        rows = [[""] + row for row in rows]
+    return rows
+
+#=====レスポンスの記録=====
+# 画像のSHA-256をファイル名にして保存する(同じ画像は上書き)
+def record_responses(contents, responses):
+    try:
+        os.makedirs(OCR_RECORD_DIR, exist_ok=True)
+        for content, response in zip(contents, responses):
+            path = os.path.join(OCR_RECORD_DIR, f"{hashlib.sha256(content).hexdigest()}.json")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(type(response).to_json(response))
+    except OSError as e:
+        ocr_log.warning("record error: %s", e)
+
+#=====OCR->CSV用データ作成処理=====
+def extract_table_from_response(response, unit="symbol"):
+    ocr_log.debug("[start: extract_table_from_response]")
+    if unit == "word":
+        texts, boxes = get_word_arrays(response)
+    else:
+        texts, boxes = get_symbol_arrays(response)
+
+    # 文字が存在しなかった場合
+    if not texts:
+        return []
+    return extract_table_body(build_table_rows(texts, boxes, unit))
+
+#=====OCR->CSV用データ作成処理(従来の処理・照合用)=====
+def extract_table_reference(response):
+    ocr_log.debug("[start: extract_table_reference]")
     # symbolsを取得
     symbols = get_symbols(response)
 
@@ -983,7 +2740,7 @@ async def extract_table_from_image(image_content):
 
 #=====重複行削除処理=====
 def remove_duplicate_rows(rows):
-    print("[start: remove_duplicate_rows]")
+    ocr_log.debug("[start: remove_duplicate_rows]")
     unique_rows = []
     for row in rows:
         if row not in unique_rows:
@@ -993,24 +2750,56 @@ def remove_duplicate_rows(rows):
 #---------------
 # リスト化関係
 #---------------
-async def handle_make_list(message):
-    print("[start: hamdle_make_list]")
-    # 改行ごとに分けてリスト化
-    lines = message.content.split("\n")
-    print(f"lines: {lines}")
-    
+# メッセージの文字数上限
+LIST_MESSAGE_LIMIT = 2000
+# まとめ投稿1件あたりの項目数上限(remove_from_listの選択肢の上限に合わせる)
+LIST_BATCH_MAX_ITEMS = 25
+
+#=====メッセージを箇条書きの項目に分解=====
+def parse_list_items(content):
     # 行頭記号リスト
     bullet = ["-", "*", "+", "•", "・", "○", "◯", "○"]
-    
-    # 空白を除去し、箇条書き化
-    for line in lines:
+
+    # 改行ごとに分け、空白を除去して箇条書き化
+    items = []
+    for line in content.split("\n"):
         line = line.strip()
-        print(f"line: {line}")
         if line[:1] in bullet:
             line = line[1:]
-            print(f"line: {line}")
         if line:
-            await message.channel.send(f"- {line}")
+            items.append(f"- {line}")
+    return items
+
+#=====項目を上限内のメッセージにまとめる=====
+def pack_list_items(items, limit=LIST_MESSAGE_LIMIT, max_items=LIST_BATCH_MAX_ITEMS):
+    chunks = []
+    current = []
+    size = 0
+    for item in items:
+        # 改行分を含めて上限を超える場合は次のメッセージへ
+        if current and (size + 1 + len(item) > limit or len(current) >= max_items):
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+        size += len(item) + (1 if current else 0)
+        current.append(item)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+#=====リスト化=====
+async def handle_make_list(message):
+    list_log.debug("[start: handle_make_list]")
+    items = parse_list_items(message.content)
+    list_log.debug("items: %s", items)
+
+    # まとめ投稿モードは上限内でまとめて送信、それ以外は1項目ずつ送信
+    if message.channel.id in all_data[message.guild.id]["batched_list_channels"]:
+        contents = pack_list_items(items)
+    else:
+        contents = items
+    for content in contents:
+        await message.channel.send(content)
     
     await message.delete()
 
@@ -1019,7 +2808,7 @@ async def handle_make_list(message):
 #---------------
 #=====vcログ作成=====
 def write_vc_log(guild_id, channel_id, start_time=None):
-    print("[start: write_vc_log]")
+    voice_log.debug("[start: write_vc_log]")
     log_texts = all_data[guild_id]["log_texts"]
 
     if channel_id in log_texts:
@@ -1030,7 +2819,7 @@ def write_vc_log(guild_id, channel_id, start_time=None):
             start_time = logs[0]["time"]
         
         # CSVファイル作成
-        filename = f"./tmp/vc_log_{channel_id}_{start_time.astimezone(JST).strftime('%Y%m%d_%H%M%S')}.csv"
+        filename = f"vc_log_{channel_id}_{start_time.astimezone(JST).strftime('%Y%m%d_%H%M%S')}.csv"
         meta = {
             "title": "vc_log",
             "speeched_at": start_time.astimezone(JST).strftime("%Y/%m/%d %H:%M")
@@ -1040,26 +2829,28 @@ def write_vc_log(guild_id, channel_id, start_time=None):
             [item["time"].astimezone(JST).strftime("%Y/%m/%d %H:%M:%S"), item["name"], item["text"]]
             for item in logs
         ]
-        make_csv(filename, rows, meta, header)
-        print(f"saved vc log: {filename}")
+        log_file = make_csv(filename, rows, meta, header)
+        voice_log.info("created vc log: %s", filename)
         
-        return filename
+        return log_file
 
 #=====録音ログ化処理=====
 async def process_voice_to_log(sink, channel: discord.TextChannel, start_time: datetime):
-    print("[start: process_voice_to_log]")
+    voice_log.debug("[start: process_voice_to_log]")
     guild_id = channel.guild.id
     log_texts = all_data[guild_id]["log_texts"]
 
+    # 発言者の表示名をまとめて取得
+    speakers = await member_names.resolve(channel.guild, list(sink.audio_data))
+
     # 録音データを発言者ごとに分解して処理
     for user_id, audio in sink.audio_data.items():
         # 表示名の取得
-        user = channel.guild.get_member(user_id) or await channel.guild.fetch_member(user_id)
-        user_name = user.nick or user.display_name or user.name
+        user_name = speakers[user_id]["name"]
 
         # userがbotなら無視
-        if user.bot:
-            print(f"skipping bot audio: {user_name}")
+        if speakers[user_id]["bot"]:
+            voice_log.debug("skipping bot audio: %s", user_name)
             continue
         
         # 発言開始までの経過時間の取得
@@ -1088,14 +2879,14 @@ async def process_voice_to_log(sink, channel: discord.TextChannel, start_time: d
             final_audio_data = buf.read()
             
             # Watson解析実行
-            res = stt.recognize(
+            res = clients.get("stt").recognize(
                 audio=final_audio_data,
                 content_type="audio/wav",
                 model="ja-JP_Multimedia",
                 timestamps=True
             ).get_result()
             
-            print(f"res: {res}")
+            voice_log.debug("res: %s", res)
             
             # 解析後のデータにそれぞれの発言時刻を付与
             if res and "results" in res:
@@ -1111,11 +2902,11 @@ async def process_voice_to_log(sink, channel: discord.TextChannel, start_time: d
                         "text": transcript.strip()
                     })
         except Exception as e:
-            print(f"error anlyzing voice from {user.nick or user.display_name or user.name}: {e}")
+            voice_log.exception("error anlyzing voice from %s: %s", user_name, e)
 
 #=====録音後処理=====
 async def after_recording(sink, channel: discord.TextChannel, start_time: datetime, *args):
-    print("[start: after_recording]")
+    voice_log.debug("[start: after_recording]")
     guild_id = channel.guild.id
     log_texts = all_data[guild_id]["log_texts"]
     await channel.send(f"⏹会議の記録を停止したよ🫡")
@@ -1124,7 +2915,7 @@ async def after_recording(sink, channel: discord.TextChannel, start_time: dateti
 
     await process_voice_to_log(sink, channel, start_time)
 
-    filename = write_vc_log(guild_id, channel.id, start_time)
+    log_file = write_vc_log(guild_id, channel.id, start_time)
     text = make_gemini_text(guild_id, channel.id)
     
     prompt = f"""
@@ -1160,7 +2951,7 @@ async def after_recording(sink, channel: discord.TextChannel, start_time: dateti
 """
 
     summerized_text = ai_handler(prompt, text)
-    print(f"summerized_text: {summerized_text}")
+    ai_log.debug("summerized_text: %s", summerized_text)
 
     # embed作成
     embed = discord.Embed(
@@ -1170,10 +2961,7 @@ async def after_recording(sink, channel: discord.TextChannel, start_time: dateti
     )
     # discordに送信
     await status_msg.edit(content="", embed=embed)
-    await channel.send(content="VCのログを作成したよ🫡", file=discord.File(filename))
-
-    # 一時ファイルを削除
-    remove_tmp_file(filename)
+    await channel.send(content="VCのログを作成したよ🫡", file=log_file)
     
     # ログテキスト辞書からチャンネルIDを削除
     remove_log_text(guild_id, channel.id, channel.name)
@@ -1194,7 +2982,7 @@ async def milkbot_talk(guild_id, channel, wait_msg):
     for message in messages:
         log_texts[channel.id].append({
             "time": message.created_at,
-            "name": message.author.nick or message.author.display_name or message.author.name,
+            "name": member_names.remember(message.guild.id, message.author)["name"],
             "text": message.content.strip()
         })
 
@@ -1290,13 +3078,14 @@ class ReminderSelect(View):
         
         #選択リストの定義
         options = []
+        now = datetime.now(JST)
         # リマインダー辞書から日時と項目を分離
         for dt, values in reminders.items():
             # 同一日時内の項目区別用インデックスを作成
             for index, v in enumerate(values, start=1):
                 msg = v["msg"]
-                # 選択肢に表示される項目を設定
-                label = f"{dt.strftime('%Y/%m/%d %H:%M')} - {msg[:50]}"
+                # 選択肢に表示される項目を設定(繰り返し予定は次回日時)
+                label = f"{format_reminder_dt(scheduler.next_fire(dt, v, now) or dt)} - {msg[:50]}"
                 # 選択時に格納される値を設定
                 value = f"{dt.isoformat()}|{index}"
                 # optionsリストに表示項目と値を格納
@@ -1380,7 +3169,11 @@ class VoteSelect(View):
                 await interaction.message.edit(content=f"**{self.voter}** の分の代理投票を取り消したよ🫡")
             else:
                 await interaction.message.delete()
-                await interaction.followup.send(content=f"⚠️取り消せる代理投票がないよ", ephemeral=True)
+                # 自分が代理投票した投票者を案内
+                records = all_data[self.guild_id]["proxy_votes"].get(msg_id, {})
+                voters = proxy_index.voters_by_agent(msg_id, records, self.agent_id)
+                hint = f"\n取り消せるのは: {', '.join(voters)}" if voters else ""
+                await interaction.followup.send(content=f"⚠️取り消せる代理投票がないよ{hint}", ephemeral=True)
         # 投票選択肢追加
         elif self.mode == VoteSelectMode.ADD_OPTION:
             lim = min(5, 10 - len(votes[msg_id]["options"]))
@@ -1399,7 +3192,8 @@ class VoteSelect(View):
         # 集計
         else:
             await interaction.response.edit_message(content=f"{bot.user.display_name}が考え中…🤔", view=None)
-            dt, result = await make_vote_result(interaction, msg_id)
+            # 最終結果は取りこぼしがないようにメッセージから照合し直す
+            dt, result = await make_vote_result(interaction, msg_id, refresh=self.mode == VoteSelectMode.FINAL_RESULT)
 
             # 結果表示処理
             if self.mode == VoteSelectMode.MID_RESULT:
@@ -1411,8 +3205,9 @@ class VoteSelect(View):
             # CSV作成処理
             await export_vote_csv(interaction, result, msg_id, dt, mode)
 
-            # 投票辞書からの削除
+            # 最終結果はアーカイブしてから投票辞書から削除
             if self.mode == VoteSelectMode.FINAL_RESULT:
+                archive_vote(self.guild_id, msg_id, dt, result)
                 remove_vote(self.guild_id, msg_id)
                 remove_proxy_vote(self.guild_id, msg_id)
 
@@ -1464,8 +3259,7 @@ class VoteOptionSelect(View):
         opt_idx = [int(opt_str) for opt_str in interaction.data["values"]]
         
         add_proxy_vote(self.guild_id, self.msg_id, self.voter, self.agent_id, opt_idx)
-        agent = guild.get_member(self.agent_id)
-        agent_display_name = agent.nick or agent.display_name or agent.name
+        agent_display_name = await member_names.name(guild, self.agent_id)
         await interaction.message.edit(content=f"**{agent_display_name}** から **{self.voter}** の分の投票を受け付けたよ🫡")
 
 #=====追加選択肢入力=====
@@ -1492,7 +3286,7 @@ class AddOptionInput(discord.ui.Modal):
 
     # 選択肢入力後の処理
     async def callback(self, interaction: discord.Interaction):
-        print("[start: on submit]")
+        vote_log.debug("[start: on submit]")
         votes = all_data[self.guild_id]["votes"]
         await interaction.response.defer()
         await interaction.message.edit(content=f"{bot.user.display_name}が考え中…🤔", view=None)
@@ -1513,7 +3307,10 @@ class AddOptionInput(discord.ui.Modal):
         # embedを書き換え
         question = votes[self.msg_id]["question"]
         description = ""
-        embed = make_poll_embed(options, reactions, question, description)
+        if votes[self.msg_id]["live"]:
+            embed = make_live_poll_embed(self.guild_id, self.msg_id, await vote_tally.get(interaction.channel, self.msg_id))
+        else:
+            embed = make_poll_embed(options, reactions, question, description)
 
         # embedを表示
         message = await interaction.channel.fetch_message(self.msg_id)
@@ -1525,7 +3322,7 @@ class AddOptionInput(discord.ui.Modal):
         await interaction.message.edit(content=f"投票に選択肢を追加したよ🫡\n{message.jump_url}")
 
         # 辞書の更新
-        add_vote(self.guild_id, self.msg_id, question, reactions, options)
+        add_vote(self.guild_id, self.msg_id, question, reactions, options, votes[self.msg_id]["live"], votes[self.msg_id]["channel_id"])
 
 #=====投票選択モード切替=====
 class VoteSelectMode(Enum):
@@ -1536,29 +3333,84 @@ class VoteSelectMode(Enum):
     ADD_OPTION = "add_option"
     DELETE_VOTE = "delete_vote"
 
+#---------------
+# リスト化関係
+#---------------
+#=====まとめ投稿の項目選択=====
+class ListItemSelect(View):
+    # クラスの初期設定
+    def __init__(self, message):
+        super().__init__()
+        # messageプロパティに対象メッセージをセット
+        self.message = message
+        # itemsプロパティにメッセージ内の項目をセット
+        self.items = message.content.split("\n")[:LIST_BATCH_MAX_ITEMS]
+
+        #選択リストの定義
+        options = [
+            discord.SelectOption(label=item.removeprefix("- ")[:100] or item[:100], value=str(i))
+            for i, item in enumerate(self.items)
+        ]
+
+        #selectUIの定義
+        select = Select(
+            placeholder="削除する項目を選択",
+            min_values=1,
+            max_values=len(options),
+            options=options
+        )
+        select.callback = self.select_callback
+        self.add_item(select)
+
+    # 削除処理の関数定義
+    async def select_callback(self, interaction: discord.Interaction):
+        selected = [self.items[int(value)] for value in interaction.data["values"]]
+
+        # 他の削除と重ならないよう最新の内容から項目を除く
+        message = await self.message.channel.fetch_message(self.message.id)
+        lines = message.content.split("\n")
+        removed = []
+        for item in selected:
+            if item in lines:
+                lines.remove(item)
+                removed.append(item)
+
+        # 項目が残っていなければメッセージごと削除
+        if lines:
+            await message.edit(content="\n".join(lines))
+        else:
+            await message.delete()
+        list_log.info("まとめ投稿から削除: %s", removed)
+
+        if removed:
+            await interaction.response.edit_message(content="\n".join(removed) + "\nを削除したよ🫡", view=None)
+        else:
+            await interaction.response.edit_message(content="⚠️選んだ項目はもう削除されているよ", view=None)
+
 #====================
 # イベントハンドラ
 #====================
 # Bot起動時処理
 @bot.event
 async def on_ready():
-    print(f"Bot started: {bot.user}")
+    log.info("Bot started: %s", bot.user)
+
+    # 再接続(セッション再開なし)の間のリアクションは届かないので、投票の集計は次回集計時に照合し直す
+    vote_tally.reset()
 
     # 統合辞書に登録されていないサーバーの場合は辞書を初期化
     for guild in bot.guilds:
         preset_dict(guild.id)
     
-    # 追加辞書の初期化
-    initialize_new_dict()
-    
-    # リマインダーループの開始
-    print(f"[start loop: {datetime.now(JST)}]")
-    bot.loop.create_task(reminder_loop())
+    # リマインダーループの開始(再接続時に二重起動しない)
+    if scheduler.task is None or scheduler.task.done():
+        reminder_log.info("[start loop]")
+        scheduler.task = bot.loop.create_task(reminder_loop())
 
 # 新規サーバー導入時処理
 @bot.event
 async def on_guild_join():
-    print("[start: on_guild_join]")
+    log.debug("[start: on_guild_join]")
     # 統合辞書に登録されていないサーバーの場合は辞書を初期化
     for guild in bot.guilds:
         preset_dict(guild.id)
@@ -1566,12 +3418,12 @@ async def on_guild_join():
 #  メッセージ受信時処理
 @bot.event
 async def on_message(message): 
-    print("[start: on_message]")
+    message_log.debug("[start: on_message]")
     # Botのメッセージは無視
     if message.author.bot:
         return
     if message.guild is None:
-        print("message.guild is None")
+        message_log.debug("message.guild is None")
         return
     make_list_channels = all_data[message.guild.id]["make_list_channels"]
     ai_chat_channels = all_data[message.guild.id]["ai_chat_channels"]
@@ -1593,7 +3445,7 @@ async def on_message(message):
     if (vc and vc.recording and message.channel.id in log_texts):
         log_texts[message.channel.id].append({
             "time": ts,
-            "name": message.author.nick or message.author.display_name or message.author.name,
+            "name": member_names.remember(message.guild.id, message.author)["name"],
             "text": message.content.strip()
         })
     # 
@@ -1603,6 +3455,43 @@ async def on_message(message):
     # その他のコマンドは実行
     await bot.process_commands(message)
 
+# メンバー情報更新時処理(表示名のキャッシュを更新)
+@bot.event
+async def on_member_update(before, after):
+    member_names.invalidate(after.guild.id, after.id)
+    member_names.remember(after.guild.id, after)
+
+# メンバー退出時処理(表示名のキャッシュを無効化)
+@bot.event
+async def on_member_remove(member):
+    member_names.invalidate(member.guild.id, member.id)
+
+# リアクション追加時処理(投票の集計を更新)
+@bot.event
+async def on_raw_reaction_add(payload):
+    if payload.user_id != bot.user.id:
+        vote_tally.add(payload.message_id, str(payload.emoji), payload.user_id)
+        live_polls.mark(payload.guild_id, payload.channel_id, payload.message_id)
+
+# リアクション削除時処理(投票の集計を更新)
+@bot.event
+async def on_raw_reaction_remove(payload):
+    if payload.user_id != bot.user.id:
+        vote_tally.remove(payload.message_id, str(payload.emoji), payload.user_id)
+        live_polls.mark(payload.guild_id, payload.channel_id, payload.message_id)
+
+# リアクション全削除時処理(次回集計時に照合し直す)
+@bot.event
+async def on_raw_reaction_clear(payload):
+    vote_tally.forget(payload.message_id)
+    live_polls.mark(payload.guild_id, payload.channel_id, payload.message_id)
+
+# 絵文字単位のリアクション削除時処理
+@bot.event
+async def on_raw_reaction_clear_emoji(payload):
+    vote_tally.clear_emoji(payload.message_id, str(payload.emoji))
+    live_polls.mark(payload.guild_id, payload.channel_id, payload.message_id)
+
 #===============
 # コマンド定義
 #===============
@@ -1618,36 +3507,36 @@ async def move_dict(ctx):
         all_data[guild_id]["reminders"] = reminders
     else:
         all_data[guild_id]["reminders"] = {}
-    print(f'reminders: {reminders}')
-    print(f'all_data[guild_id]["reminders"]: {all_data[guild_id]["reminders"]}')
+    persist_log.debug('reminders: %s', reminders)
+    persist_log.debug('all_data[guild_id]["reminders"]: %s', all_data[guild_id]["reminders"])
     
     if votes:
         all_data[guild_id]["votes"] = votes
     else:
         all_data[guild_id]["votes"] = {}
-    print(f'votes: {votes}')
-    print(f'all_data[guild_id]["votes"]: {all_data[guild_id]["votes"]}')
+    persist_log.debug('votes: %s', votes)
+    persist_log.debug('all_data[guild_id]["votes"]: %s', all_data[guild_id]["votes"])
 
     if proxy_votes:
         all_data[guild_id]["proxy_votes"] = proxy_votes
     else:
         all_data[guild_id]["proxy_votes"] = {}
-    print(f'proxy_votes: {proxy_votes}')
-    print(f'all_data[guild_id]["proxy_votes"]: {all_data[guild_id]["proxy_votes"]}')
+    persist_log.debug('proxy_votes: %s', proxy_votes)
+    persist_log.debug('all_data[guild_id]["proxy_votes"]: %s', all_data[guild_id]["proxy_votes"])
 
     if make_list_channels:
         all_data[guild_id]["make_list_channels"] = make_list_channels["channels"] or []
     else:
         all_data[guild_id]["make_list_channels"] = []
-    print(f'make_list_channels: {make_list_channels}')
-    print(f'all_data[guild_id]["make_list_channels"]: {all_data[guild_id]["make_list_channels"]}')
+    persist_log.debug('make_list_channels: %s', make_list_channels)
+    persist_log.debug('all_data[guild_id]["make_list_channels"]: %s', all_data[guild_id]["make_list_channels"])
 
     if log_texts:
         all_data[guild_id]["log_texts"] = log_texts
     else:
         all_data[guild_id]["log_texts"] = {}
     
-    print(f"all_data: {all_data}")
+    persist_log.debug("all_data: %s", all_data)
     save_all_data()
 
     await ctx.message.delete()
@@ -1656,7 +3545,7 @@ async def move_dict(ctx):
 #=====dict_export コマンド=====
 @bot.command()
 async def dict_export(ctx):
-    filename = "./data/all_data.json"
+    filename = export_all_data("all_data_export")
     await ctx.message.delete()
     await ctx.send("統合辞書のjsonファイルだよ🫡", file=discord.File(filename))
 
@@ -1669,7 +3558,7 @@ async def dict_export(ctx):
 async def remind(
     ctx: discord.ApplicationContext,
     date: discord.Option(str, description="日付(yyyy/mm/dd)"),
-    time: discord.Option(str, description="時刻(hh:mm)"),
+    time: discord.Option(str, description="時刻(hh:mm または hh:mm:ss)"),
     msg: discord.Option(str, description="内容"),
     channel: discord.Option(discord.TextChannel, description="通知するチャンネル", required=False),
     repeat: discord.Option(str, description="繰り返し単位", 
@@ -1680,12 +3569,26 @@ async def remind(
         ],
         required=False
     ),
-    interval: discord.Option(int, description="繰り返し間隔", default=0)
+    interval: discord.Option(int, description="繰り返し間隔", default=0),
+    until: discord.Option(str, description="繰り返しの終了日(yyyy/mm/dd)", required=False),
+    count: discord.Option(int, description="繰り返しの回数", required=False)
 ):
     reminders = all_data[ctx.guild.id]["reminders"]
-    print(f"channel: {channel}")
+    reminder_log.debug("channel: %s", channel)
     # 文字列引数からdatatime型に変換
-    dt = datetime.strptime(f"{date} {time}", "%Y/%m/%d %H:%M").replace(tzinfo=JST)
+    try:
+        dt = parse_reminder_dt(date, time)
+    except ValueError:
+        await ctx.interaction.response.send_message("⚠️日付は yyyy/mm/dd 、時刻は hh:mm か hh:mm:ss で入力してね", ephemeral=True)
+        return
+    # 繰り返しの終了日はその日の終わりまでを含む
+    until_dt = None
+    if until:
+        try:
+            until_dt = datetime.strptime(until, "%Y/%m/%d").replace(hour=23, minute=59, second=59, tzinfo=JST)
+        except ValueError:
+            await ctx.interaction.response.send_message("⚠️終了日は yyyy/mm/dd で入力してね", ephemeral=True)
+            return
 
     # チャンネルIDの取得
     if channel:
@@ -1699,12 +3602,12 @@ async def remind(
         return
     
     # add_reminder関数に渡す
-    add_reminder(ctx.guild.id, dt, repeat, interval, channel_id, msg)
+    add_reminder(ctx.guild.id, dt, repeat, interval, channel_id, msg, until_dt, count if repeat else None)
 
     await ctx.interaction.response.send_message(
-        content=f"**{dt.strftime('%Y/%m/%d %H:%M')}** にリマインダーをセットしたよ🫡",
+        content=f"**{format_reminder_dt(dt)}** にリマインダーをセットしたよ🫡",
         ephemeral=True)
-    print(f"予定を追加: {reminders[dt]}")
+    reminder_log.info("予定を追加: %s", reminders[dt])
 
 #=====/reminder_list コマンド=====
 @bot.slash_command(name="reminder_list", description="リマインダーの一覧を表示するよ")
@@ -1713,9 +3616,9 @@ async def reminder_list(ctx: discord.ApplicationContext):
     # 空のリストを作成
     items = []
 
-    # remindersの中身を取り出してリストに格納
+    # remindersの中身を取り出してリストに格納(次回日時順)
+    now = datetime.now(JST)
     for dt, value in reminders.items():
-        dt_str = dt.strftime("%Y/%m/%d %H:%M")
         # 同一日時の予定をrmd_dtに分解
         for rmd_dt in value:
             channel = bot.get_channel(rmd_dt["channel_id"])
@@ -1723,13 +3626,25 @@ async def reminder_list(ctx: discord.ApplicationContext):
                 mention = channel.mention
             else:
                 mention = f"ID: {rmd_dt['channel_id']}"
-            items.append((dt_str, mention, rmd_dt["msg"]))
+            # 繰り返し予定は直近の回だけを計算して表示
+            if rmd_dt["repeat"]:
+                after = max(scheduler.cursors.get(rmd_dt["id"], now), now)
+                occurrences = upcoming_occurrences(dt, rmd_dt, after, REMINDER_LIST_OCCURRENCES)
+                if not occurrences:
+                    continue
+                detail = f"{mention} - {rmd_dt['msg']}\n🔁 {format_repeat_rule(rmd_dt)}"
+                if len(occurrences) > 1:
+                    detail += "\n次回以降: " + ", ".join(format_reminder_dt(occ) for occ in occurrences[1:])
+                items.append((occurrences[0], detail))
+            else:
+                items.append((dt, f"{mention} - {rmd_dt['msg']}"))
+    items.sort(key=lambda item: item[0])
 
     # リマインダー一覧をEmbedで表示        
     if items:
         embed = discord.Embed(title="リマインダー一覧", color=discord.Color.blue())
-        for dt_txt, mention, msg in items:
-            embed.add_field(name=dt_txt, value=f"{mention} - {msg}", inline=False)
+        for next_dt, detail in items:
+            embed.add_field(name=format_reminder_dt(next_dt), value=detail, inline=False)
         await ctx.interaction.response.send_message(embed=embed)
     # リマインダーが設定されていない場合のメッセージ
     else:
@@ -1764,7 +3679,8 @@ async def vote(ctx: discord.ApplicationContext,
     opt_7: discord.Option(str,description="7番目の選択肢を書いてね", required=False),
     opt_8: discord.Option(str,description="8番目の選択肢を書いてね", required=False),
     opt_9: discord.Option(str,description="9番目の選択肢を書いてね", required=False),
-    opt_10: discord.Option(str,description="10番目の選択肢を書いてね", required=False)
+    opt_10: discord.Option(str,description="10番目の選択肢を書いてね", required=False),
+    live: discord.Option(bool, description="集計をリアルタイムで表示する", default=False)
 ): 
     # 選択肢をリストに格納
     raw_opts = [opt_1, opt_2, opt_3, opt_4, opt_5, opt_6, opt_7, opt_8, opt_9, opt_10]
@@ -1778,17 +3694,19 @@ async def vote(ctx: discord.ApplicationContext,
     # 選択肢表示を初期化
     description = ""
 
-    # Embedで出力
-    embed = make_poll_embed(options, reactions, question, description)
+    # Embedで出力(ライブ表示は0票から)
+    embed = make_poll_embed(options, reactions, question, description, [0] * len(options) if live else None)
     await ctx.interaction.response.send_message(embed=embed)
     
-    # リアクションを追加
+    # 作成直後から集計を追跡(リアクション追加中の投票も取りこぼさない)
     message = await ctx.interaction.original_response()
+    vote_tally.track(message.id)
+    # 辞書に保存
+    add_vote(ctx.guild.id, message.id, question, reactions, options, bool(live), ctx.channel.id)
+
+    # リアクションを追加
     for i in range(len(options)):
         await message.add_reaction(reactions[i])
-    
-    # 辞書に保存
-    add_vote(ctx.guild.id, message.id, question, reactions, options)
 
 #=====/vote_add_option コマンド=====
 @bot.slash_command(name="vote_add_option", description="投票に選択肢を追加するよ")
@@ -1827,6 +3745,54 @@ async def vote_result(
     else:
         await ctx.interaction.response.send_message("⚠️集計できる投票がないよ", ephemeral=True)
 
+#=====/vote_history コマンド=====
+# embedに並べる投票数の上限(フィールド数の上限)
+VOTE_HISTORY_MAX = 25
+
+@bot.slash_command(name="vote_history", description="終了した投票の結果を振り返るよ")
+@clean_slash_options
+async def vote_history(
+    ctx: discord.ApplicationContext,
+    member: discord.Option(discord.Member, description="投票内容を確認するメンバー", required=False),
+    days: discord.Option(int, description="さかのぼる日数", default=30, min_value=1),
+    limit: discord.Option(int, description="表示する投票の数", default=10, min_value=1, max_value=VOTE_HISTORY_MAX)
+):
+    until_dt = datetime.now(JST)
+    since_dt = until_dt - timedelta(days=days)
+    # 未コミットの結果も含めるため書込を済ませてから書込スレッドで検索
+    await persister.flush()
+    loop = asyncio.get_running_loop()
+    polls = await loop.run_in_executor(
+        persister.executor, repository.query_vote_archive,
+        ctx.guild.id, int(since_dt.timestamp()), int(until_dt.timestamp()), member and member.id, limit
+    )
+    vote_log.debug("vote_history: %d polls", len(polls))
+
+    if not polls:
+        await ctx.interaction.response.send_message(f"⚠️{days}日以内に終了した投票はないよ", ephemeral=True)
+        return
+
+    # Embedの設定
+    embed = discord.Embed(
+        title=f"{member_display_name(member)}の投票履歴" if member else "投票履歴",
+        description=f"{since_dt.strftime('%Y/%m/%d')} - {until_dt.strftime('%Y/%m/%d')}",
+        color=discord.Color.green()
+    )
+    for poll in polls:
+        finalized_at = datetime.fromtimestamp(poll["finalized_at"], JST)
+        if member:
+            # 選んだ選択肢
+            chosen = [f"{emoji} {option}" for i, (emoji, option) in enumerate(poll["options"]) if i in poll["choices"]]
+            value = ", ".join(chosen) if chosen else "未投票"
+        else:
+            # 選択肢ごとの票数
+            value = "\n".join(
+                f"{emoji} {option} - {poll['choices'].get(i, 0)}人" for i, (emoji, option) in enumerate(poll["options"])
+            )
+        embed.add_field(name=f"{finalized_at.strftime('%Y/%m/%d %H:%M')} {poll['question']}"[:256], value=value[:1024] or "なし", inline=False)
+
+    await ctx.interaction.response.send_message(embed=embed, allowed_mentions=discord.AllowedMentions.none())
+
 #=====/proxy_vote コマンド=====
 @bot.slash_command(name="proxy_vote", description="本人の代わりに代理投票するよ")
 async def proxy_vote(ctx: discord.ApplicationContext, voter: str = discord.Option(description="投票する本人の名前を書いてね")):
@@ -1868,7 +3834,7 @@ async def context_reaction_count(ctx: discord.ApplicationContext, message: disco
         return
 
     await ctx.interaction.response.defer()
-    print(message)
+    vote_log.debug("%s", message)
     msg_id = message.id
     
     dt, result = await make_vote_result(ctx, msg_id)
@@ -1881,29 +3847,50 @@ async def context_reaction_count(ctx: discord.ApplicationContext, message: disco
 # メンバーリスト関係
 #---------------
 #=====/export_members コマンド=====
+# 進捗表示の更新間隔(秒)
+MEMBER_EXPORT_PROGRESS_INTERVAL = 5
+
+# メンバーキャッシュが揃っていればキャッシュから、なければページごとに取得しながら返す
+async def iter_guild_members(guild):
+    if guild.chunked:
+        for member in guild.members:
+            yield member
+    else:
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
 @bot.slash_command(name="export_members", description="サーバーのメンバーリストを出力するよ")
 async def export_members(ctx: discord.ApplicationContext):
-    await ctx.interaction.response.defer()
+    status_msg = await ctx.respond(content=f"{bot.user.display_name}が考え中…🤔")
     guild = ctx.interaction.guild
     
-    filename = f"./tmp/members_list_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv"
+    filename = f"members_list_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv"
     meta = {
         "# members_at": guild.name,
         "# collected_at": datetime.now(JST).strftime("%Y/%m/%d %H:%M")
     }
     header = ["user_id", "user_name", "display_name", "is_bot"]
-    rows = [[member.id, member.name, member.nick or member.display_name or member.name, member.bot] async for member in guild.fetch_members(limit=None)]
     
-    make_csv(filename, rows, meta, header)
+    # 取得したメンバーから順に書き込む
+    writer = CsvBuffer(meta, header)
+    last_progress = time.monotonic()
+    async for member in iter_guild_members(guild):
+        writer.writerow([member.id, member.name, member_display_name(member), member.bot])
+        # 進捗表示
+        if time.monotonic() - last_progress >= MEMBER_EXPORT_PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            await status_msg.edit(content=f"メンバーを取得中…🏃 {writer.rows}人")
+    count = writer.rows
+    files = fit_upload(writer.close(), filename, guild.filesize_limit)
+    log.info("export members: %s (%s members, %s files)", guild.id, count, len(files))
     
-    # discordに送信
-    await ctx.interaction.followup.send(
-        content="メンバー一覧のCSVだよ🫡",
-        file=discord.File(filename)
-    )
-
-    # 一時ファイルの削除
-    remove_tmp_file(filename)
+    # discordに送信(上限はメッセージ全体にかかり、分割ファイルはそれぞれ上限近くまであるので1メッセージ1ファイル)
+    if len(files) == 1:
+        await status_msg.edit(content=f"メンバー一覧のCSVだよ🫡 ({count}人)", file=files[0])
+        return
+    await status_msg.edit(content=f"メンバー一覧のCSVだよ🫡 ({count}人・{len(files)}ファイル)")
+    for file in files:
+        await ctx.interaction.followup.send(file=file)
 
 #---------------
 # OCR関係
@@ -1914,42 +3901,36 @@ async def export_members(ctx: discord.ApplicationContext):
 async def table_ocr(
     ctx: discord.ApplicationContext,
     counts: discord.Option(str, description="指定時間(分)", required=False),
-    minutes: discord.Option(str, description="指定件数(件)", required=False)
+    minutes: discord.Option(str, description="指定件数(件)", required=False),
+    unit: discord.Option(str, description="読み取りの単位",
+        choices=[
+            discord.OptionChoice(name="文字", value="symbol"),
+            discord.OptionChoice(name="単語", value="word")
+        ],
+        required=False
+    )
 ):
     status_msg = await ctx.respond(content=f"{bot.user.display_name}が考え中…🤔")
 
     # 指定した範囲のメッセージを取得
     messages = await collect_message(ctx.interaction.channel, counts, minutes)
 
-    # メッセージから画像データを取得してリストに格納
-    all_contents = []
-    for message in messages:
-        contents = await get_image(ctx.interaction.channel, message)
-        if contents:
-            all_contents.extend(contents)
-
-    # visionからテキストを受け取ってCSV用に整形
-    temp_rows = []
-    for content in all_contents:
-        rows = await extract_table_from_image(content)
-        temp_rows.extend(rows)
+    # メッセージ・添付の順に画像を並べ、visionからテキストを受け取ってCSV用に整形
+    attachments = [attachment for message in messages for attachment in message.attachments]
+    temp_rows = await ocr_attachments(attachments, unit or OCR_DEFAULT_UNIT)
 
     # 重複行を削除
     rows = remove_duplicate_rows(temp_rows)
     
     # csv作成処理
-    filename = f"./tmp/ocr_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv"
-    make_csv(filename, rows)
+    ocr_file = make_csv(f"ocr_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv", rows)
     
     # CSVを出力
     await status_msg.edit(
         content="OCR結果のCSVだよ🫡",
-        file=discord.File(filename)
+        file=ocr_file
     )
 
-    # 一時ファイルの削除
-    remove_tmp_file(filename)
-
 #=====context_ocr コマンド=====
 @bot.message_command(name="context_ocr")
 async def context_ocr(ctx: discord.ApplicationContext, message: discord.Message):
@@ -1960,33 +3941,22 @@ async def context_ocr(ctx: discord.ApplicationContext, message: discord.Message)
 
     status_msg = await ctx.respond(content=f"{bot.user.display_name}が考え中…🤔")
 
-    # 画像ごとにOCR処理を実行してtemp_rowsに格納
-    temp_rows = []
-    for attachment in message.attachments:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(attachment.url) as resp:
-                content = await resp.read()
-    
-        # visionからテキストを受け取ってCSV用に整形
-        temp_rows.extend(await extract_table_from_image(content))
-    print(f"temp_rows:{temp_rows}")
+    # 画像ごとにOCR処理を並行して実行してtemp_rowsに格納
+    temp_rows = await ocr_attachments(message.attachments)
+    ocr_log.debug("temp_rows:%s", temp_rows)
     # 重複行を削除
     rows = remove_duplicate_rows(temp_rows)
-    print(f"rows:{rows}")
+    ocr_log.debug("rows:%s", rows)
     
     # csv作成処理
-    filename = f"./tmp/ocr_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv"
-    make_csv(filename, rows)
+    ocr_file = make_csv(f"ocr_{datetime.now(JST).strftime('%Y%m%d_%H%M')}.csv", rows)
     
     # CSVを出力
     await status_msg.edit(
         content="OCR結果のCSVだよ🫡",
-        file=discord.File(filename)
+        file=ocr_file
     )
 
-    # 一時ファイルの削除
-    remove_tmp_file(filename)
-
 #---------------
 # リスト化関係
 #---------------
@@ -2001,7 +3971,28 @@ async def add_listed_ch(ctx):
     add_make_list_channel(ctx.guild.id, channel_id)
     
     await ctx.message.delete()
-    await ctx.send(f"{channel_name}をリスト化対象にしたよ🫡\n今後は改行ごとに別の項目としてリスト化されるよ\nリストから削除する場合は、ロングタップ(PCの場合は右クリック)して、アプリ→**remove_from_list**で削除できるよ\n---")
+    await ctx.send(f"{channel_name}をリスト化対象にしたよ🫡\n今後は改行ごとに別の項目としてリスト化されるよ\nリストから削除する場合は、ロングタップ(PCの場合は右クリック)して、アプリ→**remove_from_list**で削除できるよ\nまとめて投稿したい場合は`!listed_mode batch`で切り替えてね\n---")
+
+#=====listed_mode コマンド=====
+@bot.command()
+async def listed_mode(ctx, mode: str = ""):
+    # コマンド実行チャンネルを取得
+    channel_id = ctx.channel.id
+    channel_name = ctx.channel.name
+    await ctx.message.delete()
+
+    if channel_id not in all_data[ctx.guild.id]["make_list_channels"]:
+        return await ctx.send(content=f"⚠️{channel_name}はリスト化対象ではないよ")
+
+    # batch: まとめて投稿 / single: 1項目ずつ投稿
+    if mode == "batch":
+        set_list_batched(ctx.guild.id, channel_id, True)
+        await ctx.send(f"{channel_name}の項目をまとめて投稿するよ🫡\nまとめた項目はremove_from_listで選んで削除できるよ")
+    elif mode == "single":
+        set_list_batched(ctx.guild.id, channel_id, False)
+        await ctx.send(f"{channel_name}の項目を1つずつ投稿するよ🫡")
+    else:
+        await ctx.send(content="⚠️モードはbatchかsingleで指定してね")
 
 #=====remove_listed_ch コマンド=====
 @bot.command()
@@ -2026,6 +4017,11 @@ async def remove_from_list(ctx: discord.ApplicationContext, message: discord.Mes
     make_list_channels = all_data[ctx.guild.id]["make_list_channels"]
     # リスト化対象チャンネル内なら項目を削除
     if message.channel.id in make_list_channels:
+        # まとめ投稿は項目を選んで削除
+        if message.author.id == bot.user.id and "\n" in message.content:
+            view = ListItemSelect(message)
+            await ctx.interaction.response.send_message(content="削除する項目を選んでね", view=view, ephemeral=True)
+            return
         await message.delete()
         await ctx.interaction.response.send_message(content=f"{message.content}を削除したよ🫡", ephemeral=True)
     # リスト化対象チャンネル以外ならエラーを返す
@@ -2038,11 +4034,11 @@ async def remove_from_list(ctx: discord.ApplicationContext, message: discord.Mes
 #=====recstart コマンド=====
 @bot.command(name="recstart")
 async def recstart(ctx):
-    print("[start: recstart]")
+    voice_log.debug("[start: recstart]")
 
     # コマンド実行者がvcに未参加の場合
     if not ctx.author.voice:
-        print("[author not in vc]")
+        voice_log.debug("[author not in vc]")
         await ctx.message.delete()
         return await ctx.send("⚠️先にボイスチャンネルに参加してね")
     
@@ -2066,24 +4062,21 @@ async def recstart(ctx):
                     break
                 await asyncio.sleep(0.5)
 
-        print(f"[connect to vc: {channel}]")
+        voice_log.info("[connect to vc: %s]", channel)
     
     except Exception as e:
-        print(f"[error: not connect vc: {e}]")
+        voice_log.error("[error: not connect vc: %s]", e)
         return await ctx.send(f"⚠️VCへの接続に失敗したよ: {e}")
     
     # すでに録音中の場合
     if getattr(vc, "recording", False):
-        print("[already recording]")
+        voice_log.info("[already recording]")
         await ctx.message.delete()
         return await ctx.send("⚠️すでに録音中だよ")
     
     start_time = datetime.now(JST)
 
-    print("vc:", vc)
-    print("is_connected:", vc.is_connected())
-    print("ws:", vc.ws)
-    print("socket:", vc.socket)
+    voice_log.debug("vc: %s, is_connected: %s, ws: %s, socket: %s", vc, vc.is_connected(), vc.ws, vc.socket)
 
     try:
         vc.start_recording(
@@ -2093,10 +4086,10 @@ async def recstart(ctx):
             start_time
         )
 
-        print("[start recording]")
+        voice_log.info("[start recording]")
     
     except Exception as e:
-        print(f"[error: not start recording: {e}]")
+        voice_log.error("[error: not start recording: %s]", e)
         return await ctx.send(f"⚠️VCの録音開始に失敗したよ: {e}")
     
     add_log_text(ctx.guild.id, ctx.channel.id)
@@ -2141,15 +4134,15 @@ async def make_log(
     for message in messages:
         log_texts[message.channel.id].append({
             "time": message.created_at,
-            "name": message.author.nick or message.author.display_name or message.author.name,
+            "name": member_names.remember(message.guild.id, message.author)["name"],
             "text": message.content.strip()
         })
 
-    # ログをcsv化して保存
-    filename = write_vc_log(guild_id, channel.id)
+    # ログをcsv化
+    log_file = write_vc_log(guild_id, channel.id)
     text = make_gemini_text(guild_id, channel.id)
     summerized_text = make_summery(text)
-    print(f"summerized_text: {summerized_text}")
+    ai_log.debug("summerized_text: %s", summerized_text)
 
     # embed作成
     embed = discord.Embed(
@@ -2159,10 +4152,7 @@ async def make_log(
     )
     # discordに送信
     await status_msg.edit(content="", embed=embed)
-    await channel.send(content="チャット会議のログを作成したよ🫡", file=discord.File(filename))
-
-    # 一時ファイルを削除
-    remove_tmp_file(filename)
+    await channel.send(content="チャット会議のログを作成したよ🫡", file=log_file)
     
     # 録音セッション辞書からチャンネルIDを削除
     remove_log_text(guild_id, channel.id, channel.name)
@@ -2200,5 +4190,16 @@ async def remove_aichat_ch(ctx):
         await ctx.message.delete()
         await ctx.send(content=f"⚠️{channel_name}はみるぼとお話してないよ")
 
-# Botを起動
-bot.run(os.getenv("DISCORD_TOKEN"))
\ No newline at end of file
+mark_startup("definitions")
+
+# ベンチマークなどからimportされた場合は起動しない
+if __name__ == "__main__":
+    # 起動時間の計測モードなら結果を表示して終了
+    if STARTUP_PROFILE:
+        print_startup_profile()
+    else:
+        # Botを起動
+        bot.run(os.getenv("DISCORD_TOKEN"))
+
+        # 終了時に未保存の変更を書き出す
+        persister.flush_sync()
\ No newline at end of file
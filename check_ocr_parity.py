@@ -0,0 +1,153 @@
+#=========================
+# 表OCRの照合
+#=========================
+# NumPy版の表の再構成(extract_table_from_response)が従来の処理(extract_table_reference)と
+# 同じ行リストを返すかを、記録したVision APIのレスポンスまたは合成データで照合する
+# --unit wordで単語単位の結果を照合する(既定値をwordにする前の確認用)
+# 記録: 環境変数OCR_RECORD_DIRを指定してBotを動かすと、レスポンスが画像ごとにjsonで保存される
+# 記録も--syntheticも指定しなければ、同梱のocr_fixtures(記録と同じAnnotateImageResponseのjson)を照合する
+# 使い方: python check_ocr_parity.py [記録ディレクトリ ...] [--synthetic 20] [--seed 0] [--unit symbol|word]
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+# 記録ディレクトリの相対パスは実行したディレクトリ基準
+START_DIR = os.getcwd()
+# 同梱のレスポンス
+FIXTURE_DIR = os.path.join(BASE_DIR, "ocr_fixtures")
+# bot.pyのimport時に作られるストレージを一時ディレクトリに逃がす
+WORK_DIR = tempfile.mkdtemp(prefix="milkbot_parity_")
+os.chdir(WORK_DIR)
+import bot
+
+#=====記録したレスポンスの読込=====
+def load_recorded(paths):
+    # 合成データだけならVisionのクライアントは不要
+    if not paths:
+        return
+    from google.cloud import vision
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            yield os.path.basename(path), vision.AnnotateImageResponse.from_json(file.read(), ignore_unknown_fields=True)
+
+#=====合成データ(ランキング表のスクリーンショット相当)=====
+def make_symbol(rng, text, x, y, width, height):
+    # 外接矩形の頂点にゆらぎを加える
+    jitter = lambda: rng.randint(-1, 1)
+    vertices = [
+        SimpleNamespace(x=x + jitter(), y=y + jitter()),
+        SimpleNamespace(x=x + width + jitter(), y=y + jitter()),
+        SimpleNamespace(x=x + width + jitter(), y=y + height + jitter()),
+        SimpleNamespace(x=x + jitter(), y=y + height + jitter()),
+    ]
+    return SimpleNamespace(text=text, bounding_box=SimpleNamespace(vertices=vertices))
+
+#---文字をまとめた単語(外接矩形は文字の矩形を囲む範囲)---
+def make_word(symbols):
+    xs = [vertice.x for symbol in symbols for vertice in symbol.bounding_box.vertices]
+    ys = [vertice.y for symbol in symbols for vertice in symbol.bounding_box.vertices]
+    vertices = [
+        SimpleNamespace(x=min(xs), y=min(ys)),
+        SimpleNamespace(x=max(xs), y=min(ys)),
+        SimpleNamespace(x=max(xs), y=max(ys)),
+        SimpleNamespace(x=min(xs), y=max(ys)),
+    ]
+    return SimpleNamespace(symbols=symbols, bounding_box=SimpleNamespace(vertices=vertices))
+
+def make_synthetic(rng):
+    chars = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZあいうえおかきくけこ順位名前点"
+    height = rng.randint(12, 28)
+    width = height * 3 // 4
+    columns = rng.randint(3, 6)
+    rows = rng.randint(30, 120)
+    words = []
+    for r in range(rows):
+        # 行ごとに少し傾きやずれを入れる
+        y = 40 + r * height * 2 + rng.randint(-height // 4, height // 4)
+        x = 20
+        for c in range(columns):
+            # まれに列が欠けた行や見出し行を混ぜる
+            if rng.random() < 0.03:
+                x += width * 12
+                continue
+            # 1つの項目はVisionでは1〜2個の単語に分かれることがある
+            symbols = []
+            for _ in range(rng.randint(1, 10)):
+                symbols.append(make_symbol(rng, rng.choice(chars), x, y + rng.randint(-2, 2), width, height))
+                x += width + rng.randint(0, 3)
+            split = rng.randint(1, len(symbols))
+            words += [make_word(part) for part in (symbols[:split], symbols[split:]) if part]
+            x += width * rng.randint(3, 8)
+    # Visionのレスポンスの並びは読み順とは限らない
+    rng.shuffle(words)
+    page = SimpleNamespace(blocks=[SimpleNamespace(paragraphs=[SimpleNamespace(words=words)])])
+    return SimpleNamespace(full_text_annotation=SimpleNamespace(pages=[page]))
+
+#=====照合=====
+def timed(func, response):
+    start = time.perf_counter()
+    result = func(response)
+    return result, time.perf_counter() - start
+
+def check(name, response, unit):
+    symbols = sum(
+        len(word.symbols)
+        for page in response.full_text_annotation.pages
+        for block in page.blocks
+        for paragraph in block.paragraphs
+        for word in paragraph.words
+    )
+    expected, reference_time = timed(bot.extract_table_reference, response)
+    actual, numpy_time = timed(lambda response: bot.extract_table_from_response(response, unit), response)
+    ok = expected == actual
+    print(f"{'ok' if ok else 'NG':<4}{name:<40}{symbols:>8}{reference_time * 1000:>12.2f}{numpy_time * 1000:>12.2f}")
+    if not ok:
+        for i, (row_expected, row_actual) in enumerate(zip(expected, actual)):
+            if row_expected != row_actual:
+                print(f"    first diff at row {i}: {row_expected} != {row_actual}")
+                break
+        else:
+            print(f"    row count: {len(expected)} != {len(actual)}")
+    return ok, reference_time, numpy_time
+
+def main():
+    parser = argparse.ArgumentParser(description="表OCRの照合")
+    parser.add_argument("records", nargs="*", help="OCR_RECORD_DIRで保存したディレクトリまたはjson(既定値: ocr_fixtures)")
+    parser.add_argument("--synthetic", type=int, default=0, help="合成データの件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unit", choices=bot.OCR_UNITS, default="symbol", help="照合する再構成の単位")
+    args = parser.parse_args()
+
+    records = args.records or ([] if args.synthetic else [FIXTURE_DIR])
+    paths = []
+    for record in records:
+        record = os.path.join(START_DIR, record)
+        paths.extend(sorted(glob.glob(os.path.join(record, "*.json"))) if os.path.isdir(record) else [record])
+    if not paths and not args.synthetic:
+        parser.error("記録ディレクトリか--syntheticを指定してね")
+
+    cases = list(load_recorded(paths))
+    rng = random.Random(args.seed)
+    cases += [(f"synthetic-{i}", make_synthetic(rng)) for i in range(args.synthetic)]
+
+    # NumPyのimportを計測に含めないよう先に済ませる
+    bot.clients.get("numpy")
+    print(f"{'':<4}{'case':<40}{'symbols':>8}{'ref (ms)':>12}{args.unit + ' (ms)':>12}")
+    results = [check(name, response, args.unit) for name, response in cases]
+    failed = sum(1 for ok, _, _ in results if not ok)
+    reference_total = sum(reference_time for _, reference_time, _ in results)
+    numpy_total = sum(numpy_time for _, _, numpy_time in results)
+    print(f"{len(results) - failed}/{len(results)} match, "
+          f"total {reference_total * 1000:.1f} ms -> {numpy_total * 1000:.1f} ms (x{reference_total / numpy_total:.1f})")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()